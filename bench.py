@@ -0,0 +1,214 @@
+# coding: utf-8
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+import hre
+from hre import HR, T, D, DS, W, A, R, compile_cache, engines, PatternLibrary
+
+
+TEXT = 'Ross McFluff: 834.345.1254 155 Elm Street id=42 level=ERROR\n' * 20000
+LINES = TEXT.splitlines()[:20000]
+
+
+def construct(n):
+    return [HR() for _ in range(n)]
+
+
+def fragments(n):
+    return [T('a') & D() & W(name='w') for _ in range(n)]
+
+
+def builder_chain(n):
+    hr = HR()
+    for _ in range(n):
+        hr.then('ab').any('xyz').range(['a', 'z'])
+    return str(hr)
+
+
+def combine_tree(n):
+    hr = T('x')
+    for i in range(n):
+        hr = (hr & A('ab')) | (T(str(i)) & R(['0', '9']))
+    return str(hr)
+
+
+def compile_distinct(n):
+    regexes = [T('k%d' % i) & DS(name='v') for i in range(n)]
+    compile_cache.clear()
+    re.purge()
+    return [hr.compile() for hr in regexes]
+
+
+def call_hot(hr, lines):
+    return [hr(line) for line in lines]
+
+
+def build_library(n):
+    return PatternLibrary(
+        ('p%d' % i, (T('k%d' % i) & T('=') & DS(name='v')) | (W(name='w') & A('!?') & R(['0', '9'])))
+        for i in range(n)
+    )
+
+
+LIBRARY = io.StringIO()
+build_library(3000).dump(LIBRARY)
+
+
+def load_library():
+    LIBRARY.seek(0)
+    return PatternLibrary.load(LIBRARY)
+
+
+PHONE = DS(name='a') & T('.') & DS(name='b') & T('.') & DS(name='c')
+
+
+def engine_patterns():
+    return [
+        DS(name='a') & T('.') & DS(name='b') & T('.') & DS(name='c'),
+        T('id=') & DS(name='id'),
+        T('level=') & W(name='level'),
+        W(name='first') & T(' ') & W(name='last') & T(':'),
+        (T('Elm') | T('Oak') | T('Pine')) & T(' Street'),
+    ]
+
+
+def engine_findall(name):
+    patterns = [hr.engine(name) for hr in engine_patterns()]
+    compile_cache.clear()
+    return [hr.findall(TEXT) for hr in patterns]
+
+
+SCENARIOS = [
+    ('construct', lambda: construct(10000)),
+    ('fragments', lambda: fragments(10000)),
+    ('builder_chain', lambda: builder_chain(1000)),
+    ('combine_tree', lambda: combine_tree(1000)),
+    ('compile', lambda: compile_distinct(1000)),
+    ('library_build', lambda: build_library(3000)),
+    ('library_load', load_library),
+    ('call_hot', lambda: call_hot(PHONE, LINES)),
+    ('extract_columns', lambda: PHONE.extract_columns(LINES, dtypes={'a': int, 'b': int, 'c': int})),
+    ('test_large', lambda: T('Sally').test(TEXT)),
+    ('findall_large', lambda: PHONE.findall(TEXT)),
+    ('replace_large', lambda: PHONE.replace(TEXT, 'xxx')),
+    ('split_large', lambda: T('\n').split(TEXT)),
+    ('parallel_findall', lambda: list(PHONE.parallel_findall(LINES, chunksize=1000))),
+] + [
+    ('engine_%s' % name, lambda name=name: engine_findall(name))
+    for name in engines.available()
+]
+
+IMPORT = 'import re, time; start = time.perf_counter(); import hre; print(time.perf_counter() - start)'
+IMPORT_RE = 'import time; start = time.perf_counter(); import re; print(time.perf_counter() - start)'
+
+
+def import_time(statement=IMPORT):
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return float(subprocess.check_output(
+        [sys.executable, '-c', statement], cwd=os.path.dirname(os.path.abspath(__file__)), env=env
+    ))
+
+
+MEMORY = [
+    ('construct', construct),
+    ('fragments', fragments),
+]
+
+
+def memory(function, n=10000):
+    tracemalloc.start()
+    objects = function(n)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size / float(n)
+
+
+def run(names=None, repeat=5):
+    results = {}
+    for name, function in SCENARIOS:
+        if names and name not in names:
+            continue
+        results[name] = {'seconds': min(timeit.repeat(function, number=1, repeat=repeat))}
+    if not names or 'import' in names:
+        import_time()
+        results['import'] = {
+            'seconds': min(import_time() for _ in range(repeat)),
+            're_seconds': min(import_time(IMPORT_RE) for _ in range(repeat)),
+        }
+    for name, function in MEMORY:
+        if name in results:
+            results[name]['bytes_per_object'] = memory(function)
+    return {
+        'hre': hre.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'results': results,
+    }
+
+
+def compare(base, current, threshold):
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        if name not in base['results']:
+            continue
+        ratio = result['seconds'] / base['results'][name]['seconds']
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = 'REGRESSION'
+        print('%-16s %10.6fs %10.6fs %7.2fx %s' % (
+            name, base['results'][name]['seconds'], result['seconds'], ratio, flag
+        ))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='hre benchmarks')
+    parser.add_argument('scenarios', nargs='*', help='scenarios to run, all by default')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='compare with the results saved in this file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression')
+    parser.add_argument(
+        '--import-budget', type=float, default=0.5,
+        help='times the duration of import re that import hre may take, after import re'
+    )
+    args = parser.parse_args(argv)
+
+    current = run(args.scenarios, args.repeat)
+    over_budget = False
+    if args.import_budget is not None and 'import' in current['results']:
+        seconds = current['results']['import']['seconds']
+        budget = args.import_budget * current['results']['import']['re_seconds']
+        if seconds > budget:
+            print('import hre took %.6fs, over the %.6fs budget (%.2fx import re)' % (
+                seconds, budget, args.import_budget
+            ))
+            over_budget = True
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        return 1 if compare(base, current, args.threshold) or over_budget else 0
+    for name, result in sorted(current['results'].items()):
+        print('%-16s %10.6fs %s' % (
+            name, result['seconds'],
+            '%8.1f bytes/object' % result['bytes_per_object'] if 'bytes_per_object' in result else ''
+        ))
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,17 @@
 import re
+import sys
 
 
+from _thread import allocate_lock as Lock
+from collections import OrderedDict
 from functools import reduce
-from operator import or_
+from operator import itemgetter, or_
+from time import perf_counter
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
 
 
 __title__ = 'HumanRegex'
@@ -10,12 +19,12 @@ __version__ = '1.0.0'
 __author__ = 'Marcelo Fonseca Tambalo'
 
 
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
 class HumanMatch(dict):
-    def __getitem__(self, item):
-        try:
-            return super(HumanMatch, self).__getitem__(item)
-        except KeyError:
-            return None
+    def __missing__(self, key):
+        return None
 
     def get(self, key, default=None):
         r = super(HumanMatch, self).get(key, default)
@@ -24,22 +33,638 @@ class HumanMatch(dict):
         return r
 
 
+class MatchView(object):
+    __slots__ = ('_match', '_keys')
+
+    def __init__(self, match=None, keys=None):
+        self._match = match
+        self._keys = _NO_KEYS if keys is None else keys
+
+    def __getitem__(self, key):
+        index = self._keys.get(key)
+        if index is None:
+            return None
+        return self._match.group(index)
+
+    def get(self, key, default=None):
+        r = self[key]
+        if r is None:
+            return default
+        return r
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        return self._keys.keys()
+
+    def values(self):
+        return [self[key] for key in self._keys]
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, MatchView)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, (dict, MatchView)):
+            return dict(self.items()) != dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        return (HumanMatch, (dict(self.items()),))
+
+
+_NO_KEYS = {}
+
+
+def _filled_match(match, keys):
+    return HumanMatch(zip(keys, map(match.group, keys.values())))
+
+
+def _match_keys(groups, groupindex, offset=0):
+    keys = dict((i, offset + i) for i in range(groups + 1))
+    keys.update((name, offset + i) for name, i in groupindex.items())
+    return keys
+
+
+class CompileCache(object):
+    def __init__(self, maxsize=1024):
+        self._maxsize = maxsize
+        self._patterns = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def _evict(self):
+        while len(self._patterns) > self._maxsize:
+            self._patterns.popitem(last=False)
+            self.evictions += 1
+
+    def compile(self, pattern, flags=0, engine=None):
+        if engine is not None and engine.name == 're':
+            engine = None
+        key = (pattern, flags) if engine is None else (pattern, flags, engine.name)
+        with self._lock:
+            compiled = self._patterns.get(key)
+            if compiled is not None:
+                self._patterns.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = None
+        if engine is not None and engine.supports(pattern, flags):
+            try:
+                compiled = engine.compile(pattern, flags)
+            except Exception:
+                compiled = None
+        if compiled is None:
+            compiled = re.compile(pattern, flags)
+        with self._lock:
+            self._patterns[key] = compiled
+            self._evict()
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._patterns.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._patterns),
+            'maxsize': self._maxsize,
+        }
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __contains__(self, key):
+        return key in self._patterns
+
+
+compile_cache = CompileCache()
+
+
+class Engine(object):
+    name = 're'
+    module_name = 're'
+    flags = None
+    unsupported = ()
+    max_repeat = None
+    bytes_patterns = True
+
+    def __init__(self):
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            import importlib
+
+            try:
+                self._module = importlib.import_module(self.module_name)
+            except ImportError:
+                self._module = False
+        return self._module or None
+
+    @property
+    def available(self):
+        return self.module is not None
+
+    def supports(self, pattern, flags=0):
+        if not self.available or self.flags is not None and flags & ~self.flags:
+            return False
+        if isinstance(pattern, bytes):
+            if not self.bytes_patterns:
+                return False
+            pattern = pattern.decode('latin-1')
+        if not self.unsupported and self.max_repeat is None:
+            return True
+        try:
+            parsed = sre_parse.parse(pattern, flags)
+        except re.error:
+            return False
+        state = _parse_state(parsed)
+        if self.flags is not None and state.flags & ~self.flags & ~re.U:
+            return False
+        flags |= state.flags
+        for op, av in _walk(parsed.data):
+            if op in self.unsupported or not self.supports_item(op, av, flags):
+                return False
+            if self.max_repeat is not None and op in _REPEATS:
+                if max(av[0], av[1] if av[1] != sre_parse.MAXREPEAT else 0) > self.max_repeat:
+                    return False
+        return True
+
+    def supports_item(self, op, av, flags):
+        return True
+
+    def compile(self, pattern, flags=0):
+        return self.module.compile(pattern, flags)
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.name)
+
+
+class RegexEngine(Engine):
+    name = 'regex'
+    module_name = 'regex'
+
+
+class RE2Engine(Engine):
+    name = 're2'
+    module_name = 're2'
+    flags = re.I | re.M | re.S | re.U
+    unsupported = tuple(
+        op for op in (
+            sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS,
+            sre_parse.ASSERT, sre_parse.ASSERT_NOT,
+            getattr(sre_parse, 'ATOMIC_GROUP', None),
+            getattr(sre_parse, 'POSSESSIVE_REPEAT', None),
+        ) if op is not None
+    )
+    max_repeat = 1000
+    bytes_patterns = False
+
+    def supports_item(self, op, av, flags):
+        # re2 only matches $ at the very end and its \b, \d, \s and \w are ASCII
+        if op is sre_parse.AT:
+            if av == sre_parse.AT_END:
+                return bool(flags & re.M)
+            boundary = av in (sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY)
+            return bool(flags & re.A) or not boundary
+        if op is sre_parse.IN and not flags & re.A:
+            return all(item[0] is not sre_parse.CATEGORY for item in av)
+        return True
+
+    def compile(self, pattern, flags=0):
+        inline = ''.join(
+            f for flag, f in ((re.I, 'i'), (re.M, 'm'), (re.S, 's')) if flags & flag
+        )
+        return self.module.compile('(?%s)%s' % (inline, pattern) if inline else pattern)
+
+
+class EngineRegistry(OrderedDict):
+    def __init__(self, default='re'):
+        super(EngineRegistry, self).__init__()
+        self.default = default
+
+    def register(self, engine):
+        self[engine.name] = engine
+        return engine
+
+    def get_engine(self, name=None):
+        name = self.default if name is None else name
+        try:
+            return self[name]
+        except KeyError:
+            raise ValueError('unknown regex engine %r' % name)
+
+    def available(self):
+        return [name for name, engine in self.items() if engine.available]
+
+
+engines = EngineRegistry()
+engines.register(Engine())
+engines.register(RegexEngine())
+engines.register(RE2Engine())
+
+
+def _flatten(fragments):
+    stack = [iter(fragments)]
+    while stack:
+        for fragment in stack[-1]:
+            if isinstance(fragment, tuple):
+                stack.append(iter(fragment))
+                break
+            yield fragment
+        else:
+            stack.pop()
+
+
+class LimitExceeded(Exception):
+    pass
+
+
+class MatchTimeout(LimitExceeded):
+    pass
+
+
+class InputTooLarge(LimitExceeded):
+    pass
+
+
+def _limited_call(pattern, flags, name, string, args, engine=None):
+    engine = None if engine is None else engines.get_engine(engine)
+    compiled = compile_cache.compile(pattern, flags, engine)
+    if name == 'groupdict':
+        match = compiled.search(string)
+        return None if match is None else (match.group(),) + match.groups()
+    result = getattr(compiled, name)(*(args + (string,)))
+    if name in ('search', 'match'):
+        return None if result is None else result.start()
+    return result
+
+
+_idle_workers = []
+_idle_workers_lock = Lock()
+
+
+def _close_workers():
+    with _idle_workers_lock:
+        while _idle_workers:
+            _idle_workers.pop().terminate()
+
+
+def _call_in_worker(pattern, flags, name, string, args, timeout, engine=None):
+    # the regex engine can only be interrupted by a signal in the main
+    # thread, elsewhere the call runs in a worker process that is killed
+    # when the time is over
+    import multiprocessing
+
+    with _idle_workers_lock:
+        pool = _idle_workers.pop() if _idle_workers else None
+    if pool is None:
+        import atexit
+
+        atexit.unregister(_close_workers)
+        atexit.register(_close_workers)
+        pool = multiprocessing.Pool(1)
+    if not isinstance(string, (str, bytes)):
+        string = bytes(string)
+    result = pool.apply_async(_limited_call, (pattern, flags, name, string, args, engine))
+    try:
+        return result.get(timeout)
+    except multiprocessing.TimeoutError:
+        pool.terminate()
+        pool = None
+        raise MatchTimeout('regex did not finish in %s seconds' % timeout)
+    finally:
+        if pool is not None:
+            with _idle_workers_lock:
+                _idle_workers.append(pool)
+
+
+def _call_with_alarm(function, timeout):
+    import signal
+
+    def alarm(signum, frame):
+        raise MatchTimeout('regex did not finish in %s seconds' % timeout)
+
+    previous = signal.signal(signal.SIGALRM, alarm)
+    delay, interval = signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = perf_counter()
+    try:
+        return function()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        if previous is not None:
+            signal.signal(signal.SIGALRM, previous)
+        if delay:
+            remaining = max(delay - (perf_counter() - start), 1e-6)
+            signal.setitimer(signal.ITIMER_REAL, remaining, interval)
+
+
+_parallel_regex = []
+
+
+def _init_parallel_worker(pattern, flags, engine=None):
+    hr = HumanRegex().add(pattern)
+    hr._flags = flags
+    hr._engine = engine
+    _parallel_regex[:] = [hr]
+
+
+def _parallel_findall(string):
+    return _parallel_regex[0].findall(string)
+
+
+def _parallel_groupdict(string):
+    return _parallel_regex[0].groupdict(string)
+
+
+class AsyncRunner(object):
+    def __init__(self, threshold=64 * 1024, max_pending=64, executor=None):
+        self.threshold = threshold
+        self.max_pending = max_pending
+        self.executor = executor
+        self._semaphores = None
+
+    def _semaphore(self, loop):
+        import asyncio
+
+        if self._semaphores is None:
+            from weakref import WeakKeyDictionary
+
+            self._semaphores = WeakKeyDictionary()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        return semaphore
+
+    def _executor(self):
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.executor = ProcessPoolExecutor()
+        return self.executor
+
+    async def run(self, hr, name, string, args=()):
+        import asyncio
+
+        compiled = hr._compiled_for(string)
+        if len(string) < self.threshold:
+            if name == 'groupdict':
+                return hr._human_match(compiled.search(string))
+            return getattr(compiled, name)(*(args + (string,)))
+        loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+        data = string if isinstance(string, (str, bytes)) else bytes(string)
+        pattern, flags = hr._source_for(string)
+        async with self._semaphore(loop):
+            result = await loop.run_in_executor(
+                self._executor(), _limited_call, pattern, flags, name, data, args, hr._engine
+            )
+        if name == 'groupdict':
+            return hr._groups_match(compiled, result)
+        if name in ('search', 'match'):
+            if result is None:
+                return None
+            # the match object can only be made by matching again from
+            # where the worker found it, which is kept off the event loop
+            return await loop.run_in_executor(None, compiled.match, string, result)
+        return result
+
+
+async_runner = AsyncRunner()
+
+
+async def _read_async_chunks(stream, chunk_size):
+    if hasattr(stream, '__aiter__') and not hasattr(stream, 'read'):
+        async for chunk in stream:
+            yield chunk
+        return
+    while True:
+        chunk = await stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_chunks(file, chunk_size):
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _column(values, dtype, numpy):
+    if dtype is None:
+        values = list(values)
+    else:
+        values = [None if value is None else dtype(value) for value in values]
+    if numpy is None:
+        return values
+    mask = [value is None for value in values]
+    if any(mask):
+        fill = next((value for value in values if value is not None), None)
+        if fill is None and isinstance(dtype, type):
+            fill = dtype()
+        values = [fill if missing else value for value, missing in zip(values, mask)]
+    return numpy.ma.array(values, mask=mask, dtype=dtype if isinstance(dtype, type) else None)
+
+
+def _trie_chain(node):
+    # follows the nodes with a single child so long words are joined
+    # in one step instead of one level per character
+    chars = []
+    while len(node) == 1 and '' not in node:
+        char, = node
+        chars.append(char)
+        node = node[char]
+    return chars, node
+
+
+def _trie_pattern(node, escape, share_suffixes):
+    # returns the regex of the words below node and whether it is a
+    # single atom that a quantifier can follow
+    chars, node = _trie_chain(node)
+    patterns = {}
+    stack = [node]
+    while stack:
+        current = stack[-1]
+        children = [
+            (char,) + tuple(_trie_chain(current[char])) for char in sorted(current) if char
+        ]
+        missing = [end for _, _, end in children if id(end) not in patterns]
+        if missing:
+            stack.extend(missing)
+            continue
+        stack.pop()
+        continuations = OrderedDict()
+        for char, run, end in children:
+            continuation = ''.join(map(escape, run)) + patterns.pop(id(end))[0]
+            key = continuation if share_suffixes or not continuation else (char, continuation)
+            continuations.setdefault(key, ([], continuation))[0].append(char)
+        patterns[id(current)] = _trie_node(current, continuations, escape)
+    pattern, atom = patterns[id(node)]
+    if chars:
+        return ''.join(map(escape, chars)) + pattern, len(chars) == 1 and not pattern
+    return pattern, atom
+
+
+def _trie_node(node, continuations, escape):
+    alternatives = []
+    for chars, continuation in continuations.values():
+        if len(chars) == 1:
+            head = escape(chars[0])
+        else:
+            head = '[%s]' % ''.join(escape(char) for char in chars)
+        alternatives.append(head + continuation)
+    if not alternatives:
+        return '', False
+    if len(alternatives) > 1:
+        pattern = '(?:%s)' % '|'.join(alternatives)
+    elif len(continuations) == 1 and '' in continuations:
+        pattern = alternatives[0]
+    elif '' in node:
+        pattern = '(?:%s)' % alternatives[0]
+    else:
+        return alternatives[0], False
+    return (pattern + '?', False) if '' in node else (pattern, True)
+
+
+class _Scanner(object):
+    def __init__(self, hr, max_match):
+        self.hr = hr
+        self.max_match = max_match
+        self.finditer = hr.compile().finditer
+        self.buffer = None
+        self.pos = 0
+        self.empty_at = None
+
+    def feed(self, chunk):
+        if self.buffer is None:
+            self.finditer = self.hr._compiled_for(chunk).finditer
+            self.buffer = chunk
+        else:
+            self.buffer = self.buffer + chunk
+        limit = len(self.buffer) - self.max_match
+        for match in self.finditer(self.buffer, self.pos):
+            start, end = match.span()
+            if start >= limit:
+                break
+            if start == end == self.empty_at:
+                continue
+            yield self.hr._human_match(match)
+            self.pos = end
+            self.empty_at = end if start == end else None
+        if limit > self.pos:
+            self.pos = limit
+            self.empty_at = None
+        # keep one character before pos so that ^ and \b still see it
+        keep = self.pos - 1
+        if keep > 0:
+            self.buffer = self.buffer[keep:]
+            self.pos -= keep
+            if self.empty_at is not None:
+                self.empty_at -= keep
+
+    def close(self):
+        if self.buffer is None:
+            self.buffer = ''
+        for match in self.finditer(self.buffer, self.pos):
+            start, end = match.span()
+            if start == end == self.empty_at:
+                continue
+            yield self.hr._human_match(match)
+
+
 class HumanRegex(str):
+    __slots__ = (
+        'prefixes', 'suffixes', '_fragments', '_source', '_pattern',
+        '_flags', '_compiled', '_compiled_bytes', '_compiled_engine', 'compilations',
+        '_limits', '_optimize', '_prefilter', '_use_prefilter', '_engine', '_keys',
+    )
+
     _AND = 'AND'
     _OR = 'OR'
 
     def __init__(self):
-        self.pattern = ''
         self.prefixes = ''
-        self.source = ''
         self.suffixes = ''
-
-        self._dotall = False
-        self._ignorecase = False
-        self._locale = False
-        self._multiline = False
-        self._unicode = False
-        self._verbose = False
+        self._fragments = []
+        self._source = ''
+        self._pattern = ''
+        self._flags = 0
+        self._compiled = None
+        self._compiled_bytes = None
+        self._compiled_engine = None
+        self.compilations = 0
+        self._limits = None
+        self._optimize = False
+        self._prefilter = None
+        self._use_prefilter = True
+        self._engine = None
+        self._keys = None
+
+    @property
+    def source(self):
+        if self._source is None:
+            self._source = ''.join(_flatten(self._fragments))
+        return self._source
+
+    @property
+    def pattern(self):
+        if self._pattern is None:
+            pattern = self.prefixes + self.source + self.suffixes
+            self._pattern = optimize(pattern, self._flags) if self._optimize else pattern
+        return self._pattern
+
+    def _rope(self):
+        return tuple(self._fragments)
+
+    def _pattern_rope(self):
+        return (self.prefixes, self._rope(), self.suffixes)
 
     def escape(self, value):
         return re.escape(value)
@@ -47,7 +672,10 @@ class HumanRegex(str):
     def add(self, value=None, name=None, quantifier=None):
         if value is not None:
             if isinstance(value, HumanRegex):
-                value = str(value)
+                if name is None and quantifier is None:
+                    value = value._pattern_rope()
+                else:
+                    value = str(value)
             if quantifier is not None:
                 if isinstance(quantifier, int):
                     value = "%s{%d}" % (value, quantifier)
@@ -57,12 +685,20 @@ class HumanRegex(str):
                     else:
                         value = "%s{%d,%d}" % (value, quantifier[0], quantifier[1])
             if name is None:
-                self.source += value
+                self._fragments.append(value)
             else:
-                self.source += '(?P<{name}>{value})'.format(name=name, value=value)
-        self.pattern = self.prefixes + self.source + self.suffixes
+                self._fragments.append('(?P<{name}>{value})'.format(name=name, value=value))
+            self._source = None
+        self._changed()
         return self
 
+    def _changed(self):
+        self._pattern = None
+        self._compiled = None
+        self._compiled_bytes = None
+        self._prefilter = None
+        self._keys = None
+
     def any(self, value, name=None, quantifier=None):
         return self.add("[" + self.escape(value) + "]", name=name, quantifier=quantifier)
 
@@ -101,6 +737,22 @@ class HumanRegex(str):
         self.suffixes = "$" if enable else ""
         return self.add()
 
+    def one_of(self, words, name=None, ignorecase=None, share_suffixes=False):
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word.lower() if ignorecase else word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        if not trie:
+            return self.add('(?!)', name=name)
+        pattern, atom = _trie_pattern(trie, self.escape, share_suffixes)
+        if ignorecase is not None:
+            pattern = '(?%s:%s)' % ('i' if ignorecase else '-i', pattern)
+        elif not atom:
+            pattern = '(?:%s)' % pattern
+        return self.add(pattern, name=name)
+
     def maybe(self, value, name=None):
         return self.add("(?:" + self.escape(value) + ")?", name=name)
 
@@ -168,81 +820,401 @@ class HumanRegex(str):
     def non_char(self, name=None, quantifier=None):
         return self.add(r"\W", name=name, quantifier=quantifier)
 
-    def dotall(self, enable=True):
-        self._dotall = enable
+    def optimize(self, enable=True):
+        self._optimize = enable
+        self._changed()
+        return self
+
+    def prefilter(self, enable=True):
+        self._use_prefilter = enable
+        self._prefilter = None
+        return self
+
+    def required_literals(self):
+        if self._flags & re.I:
+            return ()
+        try:
+            parsed = sre_parse.parse(str(self), self._flags)
+        except re.error:
+            return ()
+        if _parse_state(parsed).flags & re.I:
+            return ()
+        return tuple(sorted(set(_required_literals(parsed.data)), key=len, reverse=True))
+
+    def _misses(self, string):
+        if self._prefilter is None:
+            literals = self.required_literals() if self._use_prefilter else ()
+            self._prefilter = (literals[0], literals[0].encode('utf-8')) if literals else False
+            if not literals:
+                return False
+        if isinstance(string, str):
+            return self._prefilter[0] not in string
+        if isinstance(string, (bytes, bytearray)):
+            return self._prefilter[1] not in string
+        return False
+
+    def _set_flag(self, flag, enable):
+        if enable:
+            self._flags |= flag
+        else:
+            self._flags &= ~flag
+        self._changed()
         return self
+
+    def dotall(self, enable=True):
+        return self._set_flag(re.S, enable)
     S = dotall
 
     def ignorecase(self, enable=True):
-        self._ignorecase = enable
-        return self
+        return self._set_flag(re.I, enable)
     I = ignorecase  # noqa
 
     def locale(self, enable=True):
-        self._locale = enable
-        return self
+        return self._set_flag(re.L, enable)
     L = locale
 
     def multiline(self, enable=True):
-        self._multiline = enable
-        return self
+        return self._set_flag(re.M, enable)
     M = multiline
 
     def unicode(self, enable=True):
-        self._unicode = enable
-        return self
+        return self._set_flag(re.U, enable)
 
     def U(self, enable=True):
         return self.unicode(enable)
 
     def verbose(self, enable=True):
-        self._verbose = enable
-        return self
+        return self._set_flag(re.X, enable)
     X = verbose
 
     def get_flags(self):
-        flag = 0
-        flag = flag | re.S if self._dotall else flag | 0
-        flag = flag | re.I if self._ignorecase else flag | 0
-        flag = flag | re.L if self._locale else flag | 0
-        flag = flag | re.M if self._multiline else flag | 0
-        flag = flag | re.U if self._unicode else flag | 0
-        flag = flag | re.X if self._verbose else flag | 0
-        return flag
+        return self._flags
+
+    def engine(self, name=None):
+        if name is not None:
+            engines.get_engine(name)
+        self._engine = name
+        self._changed()
+        return self
+
+    def get_engine(self):
+        engine = engines.get_engine(self._engine)
+        if not engine.supports(str(self), self.get_flags()):
+            return 're'
+        if engine.module is not re and isinstance(self.compile(), type(re.compile(''))):
+            return 're'
+        return engine.name
+
+    def _resolve_engine(self):
+        # engines.default can change after the regex was compiled
+        engine = engines.get_engine(self._engine)
+        if engine.name != self._compiled_engine:
+            self._compiled = None
+            self._compiled_bytes = None
+            self._compiled_engine = engine.name
+        return engine
 
     def compile(self):
-        return re.compile(str(self), self.get_flags())
+        engine = self._resolve_engine()
+        if self._compiled is None:
+            self._compiled = compile_cache.compile(str(self), self.get_flags(), engine)
+            self.compilations += 1
+        return self._compiled
+
+    def compile_bytes(self):
+        engine = self._resolve_engine()
+        if self._compiled_bytes is None:
+            self._compiled_bytes = compile_cache.compile(
+                _bytes_pattern(str(self), self.get_flags()),
+                self.get_flags() & ~re.U,
+                engine
+            )
+            self.compilations += 1
+        return self._compiled_bytes
 
-    def findall(self, string):
-        return self.compile().findall(string)
+    def _source_for(self, string):
+        if isinstance(string, str):
+            return str(self), self.get_flags()
+        return _bytes_pattern(str(self), self.get_flags()), self.get_flags() & ~re.U
 
-    def groups(self, string):
-        return self.search(string).groups()
+    def _compiled_for(self, string):
+        if isinstance(string, str):
+            return self.compile()
+        return self.compile_bytes()
 
-    def groupdict(self, string):
-        result = HumanMatch()
-        match = self.search(string)
-        if match:
-            result[0] = match.group()
-            result.update(enumerate(match.groups(), start=1))
-            result.update(match.groupdict())
-        return result
+    def limit(self, timeout=None, max_input=None):
+        self._limits = None if timeout is None and max_input is None else (timeout, max_input)
+        return self
 
-    def match(self, string):
-        return self.compile().match(string)
+    def _check_input(self, string, max_input=None):
+        if max_input is None and self._limits is not None:
+            max_input = self._limits[1]
+        if max_input is not None and len(string) > max_input:
+            raise InputTooLarge(
+                'input of length %d is longer than %d' % (len(string), max_input)
+            )
+
+    def _checked(self, strings):
+        for string in strings:
+            self._check_input(string)
+            yield string
+
+    def _limited(self, name, string, args, timeout, max_input):
+        if self._limits is not None and timeout is None:
+            timeout = self._limits[0]
+        self._check_input(string, max_input)
+        compiled = self._compiled_for(string)
+        method = getattr(compiled, name)
+        if timeout is None:
+            return method(*(args + (string,)))
+        import signal
+        import threading
+
+        main_thread = threading.current_thread() is threading.main_thread()
+        if hasattr(signal, 'setitimer') and main_thread:
+            return _call_with_alarm(lambda: method(*(args + (string,))), timeout)
+        if name == 'sub' and callable(args[0]):
+            import pickle
+
+            try:
+                pickle.dumps(args[0])
+            except Exception:
+                raise TypeError(
+                    'replacement %r can not be sent to the worker process that runs a '
+                    'timeout outside the main thread' % (args[0],)
+                )
+        pattern, flags = self._source_for(string)
+        result = _call_in_worker(pattern, flags, name, string, args, timeout, self._engine)
+        if name in ('search', 'match'):
+            return None if result is None else compiled.match(string, result)
+        return result
 
-    def replace(self, string, repl):
-        return self.compile().sub(repl, string)
+    def findall(self, string, timeout=None, max_input=None):
+        if self._prefilter is not False and self._misses(string):
+            return []
+        if timeout is None and max_input is None and self._limits is None:
+            return self._compiled_for(string).findall(string)
+        return self._limited('findall', string, (), timeout, max_input)
+
+    def finditer(self, string, max_input=None):
+        if max_input is not None or self._limits is not None:
+            self._check_input(string, max_input)
+        return self._compiled_for(string).finditer(string)
+
+    def iter_groupdicts(self, string, max_input=None):
+        return map(self._human_match, self.finditer(string, max_input))
+
+    def scan(self, chunks, max_match=DEFAULT_CHUNK_SIZE):
+        scanner = _Scanner(self, max_match)
+        for chunk in chunks:
+            for match in scanner.feed(chunk):
+                yield match
+        for match in scanner.close():
+            yield match
+
+    def scan_file(self, file, chunk_size=DEFAULT_CHUNK_SIZE, lines=False, max_match=None,
+                  encoding=None):
+        if not hasattr(file, 'read'):
+            with open(file, encoding=encoding) as f:
+                for match in self.scan_file(f, chunk_size, lines, max_match):
+                    yield match
+            return
+        if lines:
+            finditer = self.compile().finditer
+            for line in file:
+                if not isinstance(line, str):
+                    finditer = self.compile_bytes().finditer
+                    line = line.rstrip(b'\r\n')
+                else:
+                    line = line.rstrip('\r\n')
+                for match in finditer(line):
+                    yield self._human_match(match)
+            return
+        chunks = _read_chunks(file, chunk_size)
+        for match in self.scan(chunks, chunk_size if max_match is None else max_match):
+            yield match
+
+    def groups(self, string, timeout=None, max_input=None):
+        return self.search(string, timeout, max_input).groups()
+
+    def _human_match(self, match):
+        if match is None:
+            return HumanMatch()
+        if self._keys is None:
+            self._keys = _match_keys(match.re.groups, match.re.groupindex)
+        return _filled_match(match, self._keys)
+
+    def _groups_match(self, compiled, groups):
+        if groups is None:
+            return HumanMatch()
+        if self._keys is None:
+            self._keys = _match_keys(compiled.groups, compiled.groupindex)
+        return HumanMatch((key, groups[index]) for key, index in self._keys.items())
+
+    def _match_view(self, match):
+        if match is None:
+            return MatchView()
+        if self._keys is None:
+            self._keys = _match_keys(match.re.groups, match.re.groupindex)
+        return MatchView(match, self._keys)
+
+    def groupdict(self, string, timeout=None, max_input=None):
+        return self._human_match(self.search(string, timeout, max_input))
+
+    def match_view(self, string, timeout=None, max_input=None):
+        return self._match_view(self.search(string, timeout, max_input))
+
+    def match(self, string, timeout=None, max_input=None):
+        if self._prefilter is not False and self._misses(string):
+            return None
+        if timeout is None and max_input is None and self._limits is None:
+            return self._compiled_for(string).match(string)
+        return self._limited('match', string, (), timeout, max_input)
+
+    def replace(self, string, repl, timeout=None, max_input=None):
+        if timeout is None and max_input is None and self._limits is None:
+            return self._compiled_for(string).sub(repl, string)
+        return self._limited('sub', string, (repl,), timeout, max_input)
     sub = replace
 
-    def search(self, string):
-        return self.compile().search(string)
+    def search(self, string, timeout=None, max_input=None):
+        if self._prefilter is not False and self._misses(string):
+            return None
+        if timeout is None and max_input is None and self._limits is None:
+            return self._compiled_for(string).search(string)
+        return self._limited('search', string, (), timeout, max_input)
+
+    def split(self, string, timeout=None, max_input=None):
+        if timeout is None and max_input is None and self._limits is None:
+            return self._compiled_for(string).split(string)
+        return self._limited('split', string, (), timeout, max_input)
+
+    def isplit(self, string, max_input=None):
+        if max_input is not None or self._limits is not None:
+            self._check_input(string, max_input)
+        if not isinstance(string, (str, bytes)):
+            parts = self._isplit(memoryview(string))
+            return (part if part is None else bytes(part) for part in parts)
+        return self._isplit(string)
+
+    def _isplit(self, string):
+        pos = 0
+        for match in self._compiled_for(string).finditer(string):
+            yield string[pos:match.start()]
+            for group in match.groups():
+                yield group
+            pos = match.end()
+        yield string[pos:]
+
+    def test(self, string, timeout=None, max_input=None):
+        return self.search(string, timeout, max_input) is not None
+
+    def count(self, string, max_input=None):
+        return sum(1 for _ in self.finditer(string, max_input))
+
+    def search_many(self, strings):
+        if self._limits is not None:
+            strings = self._checked(strings)
+        return (self._compiled_for(string).search(string) for string in strings)
+
+    def match_many(self, strings):
+        if self._limits is not None:
+            strings = self._checked(strings)
+        return (self._compiled_for(string).match(string) for string in strings)
+
+    def test_many(self, strings):
+        return (match is not None for match in self.search_many(strings))
+
+    def groupdict_many(self, strings):
+        return map(self._human_match, self.search_many(strings))
+
+    def extract_columns(self, strings, dtypes=None, use_numpy=None):
+        dtypes = {} if dtypes is None else dtypes
+        groupindex = self.compile().groupindex
+        unknown = [name for name in dtypes if name not in groupindex]
+        if unknown:
+            raise ValueError('no group named %s' % ', '.join(map(repr, unknown)))
+        names = sorted(groupindex, key=groupindex.get)
+        indexes = [groupindex[name] for name in names]
+        missing = (None,) * len(indexes)
+        rows = []
+        search = None
+        for string in strings:
+            if search is None:
+                search = self._compiled_for(string).search
+            match = search(string)
+            rows.append(missing if match is None else match.group(0, *indexes)[1:])
+        numpy = None if use_numpy is False else _import_numpy()
+        if use_numpy and numpy is None:
+            raise ImportError('extract_columns(use_numpy=True) needs numpy')
+        columns = zip(*rows) if rows else [()] * len(names)
+        return OrderedDict(
+            (name, _column(column, dtypes.get(name), numpy))
+            for name, column in zip(names, columns)
+        )
+
+    def _parallel(self, function, strings, workers, chunksize, ordered):
+        import multiprocessing
+
+        pool = multiprocessing.Pool(
+            workers, _init_parallel_worker, (str(self), int(self.get_flags()), self._engine)
+        )
+        try:
+            imap = pool.imap if ordered else pool.imap_unordered
+            for result in imap(function, strings, chunksize):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def parallel_findall(self, strings, workers=None, chunksize=256, ordered=True):
+        return self._parallel(_parallel_findall, strings, workers, chunksize, ordered)
+
+    def parallel_groupdicts(self, strings, workers=None, chunksize=256, ordered=True):
+        return self._parallel(_parallel_groupdict, strings, workers, chunksize, ordered)
+
+    async def asearch(self, string):
+        return await async_runner.run(self, 'search', string)
 
-    def split(self, string):
-        return re.split(str(self), string, flags=self.get_flags())
+    async def amatch(self, string):
+        return await async_runner.run(self, 'match', string)
 
-    def test(self, string):
-        return True if len(self.findall(string)) else False
+    async def afindall(self, string):
+        return await async_runner.run(self, 'findall', string)
+
+    async def agroupdict(self, string):
+        return await async_runner.run(self, 'groupdict', string)
+
+    async def ascan(self, stream, chunk_size=DEFAULT_CHUNK_SIZE, max_match=None):
+        scanner = _Scanner(self, chunk_size if max_match is None else max_match)
+        async for chunk in _read_async_chunks(stream, chunk_size):
+            for match in scanner.feed(chunk):
+                yield match
+        for match in scanner.close():
+            yield match
+
+    def freeze(self):
+        return FrozenHR(self)
+
+    def thaw(self):
+        hr = HumanRegex()
+        hr.prefixes = self.prefixes
+        hr.suffixes = self.suffixes
+        hr._fragments = list(self._fragments)
+        hr._source = None
+        hr._flags = self._flags
+        hr._limits = self._limits
+        hr._optimize = self._optimize
+        hr._use_prefilter = self._use_prefilter
+        hr._engine = self._engine
+        return hr.add()
+
+    def analyze(self, warn=False):
+        return analyze(self, warn)
+
+    def harden(self):
+        return harden(self)
 
     def __str__(self):
         return r"%s" % self.pattern
@@ -256,12 +1228,15 @@ class HumanRegex(str):
     def __repr__(self):
         return repr(str(self))
 
-    def __call__(self, string):
-        return self.groupdict(string)
+    def __call__(self, string, timeout=None, max_input=None):
+        return self.groupdict(string, timeout, max_input)
 
     def __mul__(self, other):
         if isinstance(other, int):
-            return HR().add(str(self) * other)
+            hr = HR()
+            hr._fragments = [self._pattern_rope()] * other
+            hr._source = None
+            return hr.add()
         raise TypeError(
             "unsupported operand type(s) for *: '%s' and '%s'" % (
                 type(self).__name__,
@@ -280,19 +1255,18 @@ class HumanRegex(str):
 
         hr = HumanRegex()
 
-        hr._dotall = self._dotall | other._dotall
-        hr._ignorecase = self._ignorecase | other._ignorecase
-        hr._locale = self._locale | other._locale
-        hr._multiline = self._multiline | other._multiline
-        hr._unicode = self._unicode | other._unicode
-        hr._verbose = self._verbose | other._verbose
-
+        hr._flags = self._flags | other._flags
+        hr._optimize = self._optimize or other._optimize
+        hr._use_prefilter = self._use_prefilter and other._use_prefilter
+        hr._engine = self._engine or other._engine
         hr.prefixes = self.prefixes if self.prefixes else other.prefixes
         hr.suffixes = other.suffixes if other.suffixes else self.suffixes
-        hr.add(self.source)
+        hr._fragments.append(self._rope())
         if op == 'OR':
-            hr.OR()
-        return hr.add(other.source)
+            hr._fragments.append('|')
+        hr._fragments.append(other._rope())
+        hr._source = None
+        return hr.add()
 
     def __or__(self, other):
         return self._combine(other, self._OR)
@@ -304,6 +1278,179 @@ class HumanRegex(str):
 HR = HumanRegex
 
 
+class FrozenHR(HumanRegex):
+    __slots__ = ('groupindex', '_key', '_hash')
+
+    _MUTABLE = ('_compiled', '_compiled_bytes', '_compiled_engine', 'compilations')
+
+    def __new__(cls, hr):
+        return super(FrozenHR, cls).__new__(cls, str(hr))
+
+    def __init__(self, hr):
+        super(FrozenHR, self).__init__()
+        self.prefixes = hr.prefixes
+        self.suffixes = hr.suffixes
+        self._fragments = tuple(hr._fragments)
+        self._source = hr.source
+        self._pattern = hr.pattern
+        self._flags = hr._flags
+        self._limits = hr._limits
+        self._optimize = hr._optimize
+        self._use_prefilter = hr._use_prefilter
+        self._engine = hr._engine
+        self._misses('')
+        self.groupindex = self.compile().groupindex
+        self._keys = _match_keys(self._compiled.groups, self._compiled.groupindex)
+        self._key = (self._pattern, int(self._flags), self._engine)
+        self._hash = hash(self._key)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, '_hash') and name not in self._MUTABLE:
+            raise TypeError("'FrozenHR' object is immutable")
+        super(FrozenHR, self).__setattr__(name, value)
+
+    def add(self, value=None, name=None, quantifier=None):
+        raise TypeError("'FrozenHR' object is immutable")
+
+    def freeze(self):
+        return self
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenHR):
+            return self._key == other._key
+        return False
+
+    def __ne__(self, other):
+        if isinstance(other, FrozenHR):
+            return self._key != other._key
+        return True
+
+    def __reduce__(self):
+        return (_thawed_freeze, (self.thaw(),))
+
+    def __mul__(self, other):
+        return super(FrozenHR, self).__mul__(other).freeze()
+
+    def _combine(self, other, op=HumanRegex._AND):
+        if isinstance(other, (Flag, Flags)):
+            return self.thaw()._combine(other, op).freeze()
+        return super(FrozenHR, self)._combine(other, op).freeze()
+
+
+def _thawed_freeze(hr):
+    return hr.freeze()
+
+
+def _matched(name, string, result):
+    if name in ('search', 'match'):
+        return result is not None
+    if name == 'split':
+        return len(result) > 1
+    if name in ('replace', 'sub'):
+        return result != string
+    if name == 'groupdict':
+        return 0 in result
+    return bool(result)
+
+
+class Profiler(object):
+    methods = ('search', 'match', 'findall', 'split', 'replace', 'sub', 'groupdict')
+
+    def __init__(self):
+        self.enabled = False
+        self._originals = {}
+        self._stats = {}
+        self._lock = Lock()
+
+    def _stat(self, hr, name):
+        key = (str(hr), int(hr.get_flags()))
+        methods = self._stats.setdefault(key, {})
+        stat = methods.get(name)
+        if stat is None:
+            stat = methods[name] = {
+                'calls': 0, 'seconds': 0.0, 'input_size': 0, 'matches': 0, 'misses': 0,
+            }
+        return stat
+
+    def record(self, hr, name, seconds, string=None, matched=None):
+        with self._lock:
+            stat = self._stat(hr, name)
+            stat['calls'] += 1
+            stat['seconds'] += seconds
+            if string is not None:
+                stat['input_size'] += len(string)
+            if matched is not None:
+                stat['matches' if matched else 'misses'] += 1
+
+    def _wrap_compile(self, name, method, cached):
+        def compile(hr):
+            if getattr(hr, cached) is not None:
+                return method(hr)
+            start = perf_counter()
+            result = method(hr)
+            self.record(hr, name, perf_counter() - start)
+            return result
+        return compile
+
+    def _wrap(self, name, method):
+        def wrapper(hr, string, *args, **kwargs):
+            start = perf_counter()
+            result = method(hr, string, *args, **kwargs)
+            seconds = perf_counter() - start
+            self.record(hr, name, seconds, string, _matched(name, string, result))
+            return result
+        return wrapper
+
+    def enable(self):
+        if self.enabled:
+            return self
+        for name, cached in (('compile', '_compiled'), ('compile_bytes', '_compiled_bytes')):
+            self._originals[name] = getattr(HumanRegex, name)
+            setattr(HumanRegex, name, self._wrap_compile(name, self._originals[name], cached))
+        for name in self.methods:
+            self._originals[name] = getattr(HumanRegex, name)
+            setattr(HumanRegex, name, self._wrap(name, self._originals[name]))
+        self.enabled = True
+        return self
+
+    def disable(self):
+        for name, method in self._originals.items():
+            setattr(HumanRegex, name, method)
+        self._originals.clear()
+        self.enabled = False
+        return self
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                (key, dict((name, dict(stat)) for name, stat in methods.items()))
+                for key, methods in self._stats.items()
+            )
+
+    def top(self, n=10):
+        totals = [
+            (sum(stat['seconds'] for stat in methods.values()), key)
+            for key, methods in self.snapshot().items()
+        ]
+        return [key for _, key in sorted(totals, reverse=True)[:n]]
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+
+profiler = Profiler()
+
+
 class Flags(set):
     def __or__(self, other):
         if isinstance(other, (Flag, HR)):
@@ -388,6 +1535,720 @@ class FX(Flag):
     f_name = 'verbose'
 
 
+_SCOPED_FLAGS = ((re.A, 'a'), (re.I, 'i'), (re.L, 'L'), (re.M, 'm'), (re.S, 's'))
+
+
+def _rename_groups(pattern, flags, prefix):
+    # names every capturing group prefix + number, rewrites the references
+    # to them and moves the global flags into a scoped group, the
+    # numbering of the groups is not changed
+    parsed = sre_parse.parse(pattern, flags)
+    state = _parse_state(parsed)
+    count = state.groups - 1
+    names = dict((i, '%s%d' % (prefix, i)) for i in range(1, count + 1))
+    source = _unparse(parsed.data, names)
+    scoped = ''.join(f for flag, f in _SCOPED_FLAGS if state.flags & flag)
+    if scoped:
+        source = '(?%s:%s)' % (scoped, source)
+    return source, count, dict(state.groupdict)
+
+
+class PatternSet(object):
+    def __init__(self, patterns=()):
+        self.patterns = OrderedDict()
+        self._compiled = None
+        self._compiled_bytes = None
+        self._members = {}
+        self._source = None
+        self.update(patterns)
+
+    def add(self, name, hr):
+        if not isinstance(hr, HumanRegex):
+            hr = HR().add(hr)
+        self.patterns[name] = hr
+        self._source = None
+        self._compiled = None
+        self._compiled_bytes = None
+        return self
+
+    def update(self, patterns):
+        if hasattr(patterns, 'items'):
+            patterns = patterns.items()
+        for name, hr in patterns:
+            self.add(name, hr)
+        return self
+
+    @property
+    def source(self):
+        if self._source is None:
+            self._build()
+        return self._source
+
+    def _build(self):
+        branches = []
+        self._members = {}
+        index = 0
+        for i, (name, hr) in enumerate(self.patterns.items()):
+            source, count, names = _rename_groups(str(hr), hr.get_flags(), '_hre%d_' % i)
+            branches.append('(' + source + ')')
+            index += 1
+            self._members[index] = (name, _match_keys(count, names, index))
+            index += count
+        self._source = '|'.join(branches) or '(?!)'
+
+    def compile(self):
+        if self._compiled is None:
+            self._compiled = compile_cache.compile(self.source)
+        return self._compiled
+
+    def compile_bytes(self):
+        if self._compiled_bytes is None:
+            self._compiled_bytes = compile_cache.compile(_bytes_pattern(self.source))
+        return self._compiled_bytes
+
+    def _compiled_for(self, string):
+        if isinstance(string, str):
+            return self.compile()
+        return self.compile_bytes()
+
+    def _dispatch(self, match):
+        if match is None:
+            return None, HumanMatch()
+        name, keys = self._members[match.lastindex]
+        return name, _filled_match(match, keys)
+
+    def match(self, string):
+        return self._dispatch(self._compiled_for(string).match(string))
+
+    def search(self, string):
+        return self._dispatch(self._compiled_for(string).search(string))
+
+    def finditer(self, string):
+        return map(self._dispatch, self._compiled_for(string).finditer(string))
+
+    def __call__(self, string):
+        return self.search(string)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __contains__(self, name):
+        return name in self.patterns
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, list(self.patterns))
+
+
+Router = PatternSet
+
+
+LIBRARY_FORMAT = 1
+
+
+class StaleLibrary(ValueError):
+    pass
+
+
+class PatternLibrary(object):
+    def __init__(self, patterns=()):
+        import threading
+
+        self.patterns = OrderedDict()
+        self.groupindex = {}
+        self.compiled = threading.Event()
+        self.update(patterns)
+
+    def add(self, name, hr):
+        if not isinstance(hr, HumanRegex):
+            hr = HR().add(hr)
+        self.patterns[name] = hr
+        self.groupindex.pop(name, None)
+        self.compiled.clear()
+        return self
+
+    def update(self, patterns):
+        if hasattr(patterns, 'items'):
+            patterns = patterns.items()
+        for name, hr in patterns:
+            self.add(name, hr)
+        return self
+
+    def compile(self, background=False):
+        if background:
+            import threading
+
+            thread = threading.Thread(
+                target=self.compile, name='hre-library-compile', daemon=True
+            )
+            thread.start()
+            return thread
+        for hr in list(self.patterns.values()):
+            hr.compile()
+        self.compiled.set()
+
+    def wait(self, timeout=None):
+        return self.compiled.wait(timeout)
+
+    def _entries(self):
+        entries = []
+        for name, hr in self.patterns.items():
+            groupindex = self.groupindex.get(name)
+            if groupindex is None:
+                groupindex = dict(hr.compile().groupindex)
+            entries.append([
+                name, hr.prefixes, hr.source, hr.suffixes, int(hr.get_flags()),
+                hr.pattern if hr._optimize else None, hr._engine, groupindex,
+            ])
+        return entries
+
+    def dump(self, file, key=None):
+        import hashlib
+        import json
+
+        if not hasattr(file, 'write'):
+            with open(file, 'w', encoding='utf-8') as f:
+                return self.dump(f, key)
+        payload = json.dumps(self._entries(), separators=(',', ':'))
+        header = {
+            'format': LIBRARY_FORMAT,
+            'hre': __version__,
+            'key': key,
+            'hash': hashlib.sha256(payload.encode('utf-8')).hexdigest(),
+        }
+        file.write(json.dumps(header, sort_keys=True))
+        file.write('\n')
+        file.write(payload)
+
+    @classmethod
+    def _read(cls, file, key):
+        import hashlib
+        import json
+
+        try:
+            header = json.loads(file.readline())
+        except ValueError:
+            raise StaleLibrary('not a pattern library')
+        if not isinstance(header, dict):
+            raise StaleLibrary('not a pattern library')
+        if header.get('format') != LIBRARY_FORMAT or header.get('hre') != __version__:
+            raise StaleLibrary('library written by hre %s format %s' % (
+                header.get('hre'), header.get('format')
+            ))
+        if header.get('key') != key:
+            raise StaleLibrary('library key %r is not %r' % (header.get('key'), key))
+        payload = file.read()
+        if hashlib.sha256(payload.encode('utf-8')).hexdigest() != header.get('hash'):
+            raise StaleLibrary('library hash does not match its contents')
+        library = cls()
+        for entry in json.loads(payload):
+            name, prefixes, source, suffixes, flags, optimized, engine, groupindex = entry
+            hr = HumanRegex()
+            hr.prefixes = prefixes
+            hr.suffixes = suffixes
+            hr._fragments.append(source)
+            hr._source = source
+            hr._flags = flags
+            hr._engine = engine
+            if optimized is None:
+                hr._pattern = prefixes + source + suffixes
+            else:
+                hr._optimize = True
+                hr._pattern = optimized
+            library.patterns[name] = hr
+            library.groupindex[name] = groupindex
+        return library
+
+    @classmethod
+    def load(cls, file, key=None, build=None, compile='lazy'):
+        if compile not in ('lazy', 'eager', 'background'):
+            raise ValueError("compile must be 'lazy', 'eager' or 'background'")
+        try:
+            if hasattr(file, 'read'):
+                library = cls._read(file, key)
+            else:
+                with open(file, encoding='utf-8') as f:
+                    library = cls._read(f, key)
+        except (OSError, StaleLibrary):
+            if build is None:
+                raise
+            library = cls(build())
+            if not hasattr(file, 'read'):
+                library.dump(file, key)
+        if compile == 'eager':
+            library.compile()
+        elif compile == 'background':
+            library.compile(background=True)
+        return library
+
+    def __getitem__(self, name):
+        return self.patterns[name]
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __contains__(self, name):
+        return name in self.patterns
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, list(self.patterns))
+
+
+POSSESSIVE = sys.version_info >= (3, 11)
+
+
+class BacktrackingRisk(tuple):
+    __slots__ = ()
+
+    _fields = ('kind', 'fragment')
+
+    def __new__(cls, kind, fragment):
+        return tuple.__new__(cls, (kind, fragment))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    kind = property(itemgetter(0))
+    fragment = property(itemgetter(1))
+
+    def __repr__(self):
+        return 'BacktrackingRisk(kind=%r, fragment=%r)' % self
+
+
+class BacktrackingWarning(UserWarning):
+    pass
+
+
+_REPEATS = (
+    sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)
+)
+_CHARS = (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.ANY, sre_parse.IN)
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: r'\d',
+    sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s',
+    sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w',
+    sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+_AT = {
+    sre_parse.AT_BEGINNING: '^',
+    sre_parse.AT_BEGINNING_STRING: r'\A',
+    sre_parse.AT_END: '$',
+    sre_parse.AT_END_STRING: r'\Z',
+    sre_parse.AT_BOUNDARY: r'\b',
+    sre_parse.AT_NON_BOUNDARY: r'\B',
+}
+_DISJOINT_CATEGORIES = set(frozenset(pair) for pair in (
+    (sre_parse.CATEGORY_DIGIT, sre_parse.CATEGORY_NOT_DIGIT),
+    (sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_NOT_SPACE),
+    (sre_parse.CATEGORY_WORD, sre_parse.CATEGORY_NOT_WORD),
+    (sre_parse.CATEGORY_DIGIT, sre_parse.CATEGORY_SPACE),
+    (sre_parse.CATEGORY_DIGIT, sre_parse.CATEGORY_NOT_WORD),
+    (sre_parse.CATEGORY_WORD, sre_parse.CATEGORY_SPACE),
+))
+_DISJOINT = {}
+
+
+def _character_set(patterns, flags):
+    # the characters and the categories matched by patterns, None when
+    # they match something else (., negations, large ranges)
+    characters = set()
+    categories = set()
+    for pattern in patterns:
+        for op, av in sre_parse.parse(pattern, flags).data:
+            if op is sre_parse.LITERAL:
+                characters.add(av)
+                continue
+            if op is not sre_parse.IN:
+                return None
+            for kind, value in av:
+                if kind is sre_parse.LITERAL:
+                    characters.add(value)
+                elif kind is sre_parse.RANGE and value[1] - value[0] < 4096:
+                    characters.update(range(value[0], value[1] + 1))
+                elif kind is sre_parse.CATEGORY:
+                    categories.add(value)
+                else:
+                    return None
+    return characters, categories
+
+
+def _scan_disjoint(first, second, flags):
+    search = re.compile('(?=%s)(?:%s)' % ('|'.join(first), '|'.join(second)), flags).search
+    for start in range(0, sys.maxunicode + 1, 0x10000):
+        end = min(start + 0x10000, sys.maxunicode + 1)
+        characters = ''.join(chr(i) for i in range(start, end) if not 0xD800 <= i <= 0xDFFF)
+        if search(characters):
+            return False
+    return True
+
+
+def _disjoint(first, second, flags):
+    # None stands for "any character"; an empty tuple for "no character"
+    if first is None or second is None:
+        return False
+    if not first or not second:
+        return True
+    flags &= ~(re.X | re.L)
+    key = (first, second, flags)
+    result = _DISJOINT.get(key)
+    if result is not None:
+        return result
+    first_set = _character_set(first, flags)
+    second_set = _character_set(second, flags)
+    if first_set is None or second_set is None:
+        result = _scan_disjoint(first, second, flags)
+    else:
+        first_match = re.compile('|'.join(first), flags).match
+        second_match = re.compile('|'.join(second), flags).match
+        result = not (
+            any(second_match(chr(c)) for c in first_set[0]) or
+            any(first_match(chr(c)) for c in second_set[0])
+        ) and all(
+            frozenset((a, b)) in _DISJOINT_CATEGORIES
+            for a in first_set[1] for b in second_set[1]
+        )
+    if len(_DISJOINT) >= 4096:
+        _DISJOINT.clear()
+    _DISJOINT[key] = result
+    return result
+
+
+_GROUP_FLAGS = (
+    (re.A, 'a'), (re.I, 'i'), (re.L, 'L'), (re.M, 'm'), (re.S, 's'), (re.U, 'u'), (re.X, 'x')
+)
+
+
+def _unparse_class(av):
+    out = []
+    for op, value in av:
+        if op is sre_parse.NEGATE:
+            out.append('^')
+        elif op is sre_parse.LITERAL:
+            out.append(re.escape(chr(value)))
+        elif op is sre_parse.RANGE:
+            out.append('%s-%s' % (re.escape(chr(value[0])), re.escape(chr(value[1]))))
+        elif op is sre_parse.CATEGORY:
+            out.append(_CATEGORIES[value])
+    if len(av) == 1 and av[0][0] is sre_parse.CATEGORY:
+        return out[0]
+    return '[%s]' % ''.join(out)
+
+
+def _unparse(items, names, conditional=False):
+    out = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            out.append(re.escape(chr(av)))
+        elif op is sre_parse.NOT_LITERAL:
+            out.append('[^%s]' % re.escape(chr(av)))
+        elif op is sre_parse.ANY:
+            out.append('.')
+        elif op is sre_parse.IN:
+            out.append(_unparse_class(av))
+        elif op is sre_parse.AT:
+            out.append(_AT[av])
+        elif op is sre_parse.BRANCH:
+            branch = '|'.join(_unparse(item, names) for item in av[1])
+            out.append(branch if len(items) == 1 and not conditional else '(?:%s)' % branch)
+        elif op is sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, p = av
+            if group is None:
+                flags = ''.join(f for flag, f in _GROUP_FLAGS if add_flags & flag)
+                if del_flags:
+                    flags += '-' + ''.join(f for flag, f in _GROUP_FLAGS if del_flags & flag)
+                out.append('(?%s:%s)' % (flags, _unparse(p, names)))
+            elif group in names:
+                out.append('(?P<%s>%s)' % (names[group], _unparse(p, names)))
+            else:
+                out.append('(%s)' % _unparse(p, names))
+        elif op in _REPEATS:
+            low, high, p = av
+            body = _unparse(p, names)
+            if len(p) != 1 or p[0][0] in _REPEATS or p[0][0] is sre_parse.BRANCH or (
+                p[0][0] is sre_parse.LITERAL and p[0][1] > 0x7f
+            ):
+                body = '(?:%s)' % body
+            if (low, high) == (0, sre_parse.MAXREPEAT):
+                quantifier = '*'
+            elif (low, high) == (1, sre_parse.MAXREPEAT):
+                quantifier = '+'
+            elif (low, high) == (0, 1):
+                quantifier = '?'
+            elif low == high:
+                quantifier = '{%d}' % low
+            elif high == sre_parse.MAXREPEAT:
+                quantifier = '{%d,}' % low
+            else:
+                quantifier = '{%d,%d}' % (low, high)
+            if op is sre_parse.MIN_REPEAT:
+                quantifier += '?'
+            elif op is not sre_parse.MAX_REPEAT:
+                quantifier += '+'
+            out.append(body + quantifier)
+        elif op is sre_parse.GROUPREF:
+            out.append('(?P=%s)' % names[av] if av in names else '(?:\\%d)' % av)
+        elif op is sre_parse.GROUPREF_EXISTS:
+            group, yes, no = av
+            out.append('(?(%s)%s%s)' % (
+                names.get(group, group),
+                _unparse(yes, names, True),
+                '|' + _unparse(no, names, True) if no else '',
+            ))
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            direction, p = av
+            out.append('(?%s%s%s)' % (
+                '<' if direction < 0 else '',
+                '=' if op is sre_parse.ASSERT else '!',
+                _unparse(p, names),
+            ))
+        else:  # ATOMIC_GROUP
+            out.append('(?>%s)' % _unparse(av, names))
+    return ''.join(out)
+
+
+def _parse_state(parsed):
+    # the parser state is called pattern before Python 3.8
+    return getattr(parsed, 'state', None) or parsed.pattern
+
+
+def _walk(items):
+    for op, av in items:
+        yield op, av
+        if op is sre_parse.SUBPATTERN:
+            children = [av[3]]
+        elif op in _REPEATS:
+            children = [av[2]]
+        elif op is sre_parse.BRANCH:
+            children = av[1]
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            children = [av[1]]
+        elif op is sre_parse.GROUPREF_EXISTS:
+            children = [branch for branch in av[1:] if branch]
+        elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+            children = [av]
+        else:
+            children = []
+        for child in children:
+            for item in _walk(child):
+                yield item
+
+
+def _first(items, start=0, flags=None):
+    # characters that can start a match of items[start:] and whether
+    # items[start:] can match the empty string; with flags, the anchors
+    # other than the end of the string make the characters unknown
+    first = ()
+    for op, av in items[start:]:
+        if op in _CHARS:
+            return first + (_unparse([(op, av)], {}),), False
+        if op is sre_parse.AT:
+            if flags is not None and av != sre_parse.AT_END_STRING and (
+                av != sre_parse.AT_END or flags & re.M
+            ):
+                return None, True
+            continue
+        if op is sre_parse.SUBPATTERN and not av[1] and not av[2]:
+            item_first, nullable = _first(av[3], 0, flags)
+        elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+            item_first, nullable = _first(av, 0, flags)
+        elif op in _REPEATS:
+            item_first, nullable = _first(av[2], 0, flags)
+            nullable = nullable or av[0] == 0
+        elif op is sre_parse.BRANCH:
+            item_first, nullable = (), False
+            for branch in av[1]:
+                branch_first, branch_nullable = _first(branch, 0, flags)
+                if branch_first is None:
+                    return None, True
+                item_first += branch_first
+                nullable = nullable or branch_nullable
+        else:
+            return None, True
+        if item_first is None:
+            return None, True
+        first += item_first
+        if not nullable:
+            return first, False
+    return first, True
+
+
+def _variable(op, av):
+    return op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] != av[1]
+
+
+def _contains_variable_repeat(items):
+    for op, av in items:
+        if _variable(op, av):
+            return True
+        if op is sre_parse.SUBPATTERN and _contains_variable_repeat(av[3]):
+            return True
+        if op is sre_parse.BRANCH:
+            if len(set(_first(branch)[1] for branch in av[1])) > 1:
+                return True
+            if any(_contains_variable_repeat(branch) for branch in av[1]):
+                return True
+    return False
+
+
+def _analyze(items, flags, names, repeated, risks):
+    for i, (op, av) in enumerate(items):
+        if op is sre_parse.SUBPATTERN:
+            _analyze(av[3], flags, names, repeated, risks)
+        elif op is sre_parse.BRANCH:
+            if repeated:
+                firsts = [_first(branch)[0] for branch in av[1]]
+                for j, first in enumerate(firsts):
+                    if any(not _disjoint(first, other, flags) for other in firsts[j + 1:]):
+                        risks.append(BacktrackingRisk(
+                            'ambiguous_alternation', _unparse([(op, av)], names)
+                        ))
+                        break
+            for branch in av[1]:
+                _analyze(branch, flags, names, repeated, risks)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            _analyze(av[1], flags, names, False, risks)
+        elif op in _REPEATS:
+            variable = _variable(op, av)
+            if variable and av[1] > 1 and _contains_variable_repeat(av[2]):
+                risks.append(BacktrackingRisk(
+                    'nested_quantifier', _unparse([(op, av)], names)
+                ))
+            if variable:
+                for next_op, next_av in items[i + 1:]:
+                    if next_op is sre_parse.AT:
+                        continue
+                    if _variable(next_op, next_av) and not _disjoint(
+                        _first(av[2])[0], _first(next_av[2])[0], flags
+                    ):
+                        risks.append(BacktrackingRisk(
+                            'overlapping_quantifiers',
+                            _unparse([(op, av), (next_op, next_av)], names)
+                        ))
+                    break
+            _analyze(av[2], flags, names, repeated or av[1] > 1, risks)
+
+
+def _harden(items, follow, flags):
+    # follow: characters that can come after items, None when unknown
+    hardened = []
+    for i, (op, av) in enumerate(items):
+        rest, nullable = _first(items, i + 1, flags)
+        if rest is not None and nullable:
+            rest = None if follow is None else rest + follow
+        if op is sre_parse.SUBPATTERN:
+            # what follows the group is matched with the outer flags
+            group_flags = (flags | av[1]) & ~av[2]
+            group_follow = rest if group_flags == flags else None
+            av = av[:3] + (_harden(av[3], group_follow, group_flags),)
+        elif op is sre_parse.BRANCH:
+            av = (av[0], [_harden(branch, rest, flags) for branch in av[1]])
+        elif op is sre_parse.MAX_REPEAT and av[0] != av[1]:
+            low, high, p = av
+            if len(p) == 1 and p[0][0] in _CHARS and _disjoint(_first(p)[0], rest, flags):
+                op = sre_parse.POSSESSIVE_REPEAT
+        hardened.append((op, av))
+    return hardened
+
+
+_INLINE_FLAGS = ((re.A, 'a'), (re.I, 'i'), (re.L, 'L'), (re.M, 'm'), (re.S, 's'), (re.X, 'x'))
+
+
+def optimize(pattern, flags=0):
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return pattern
+    state = _parse_state(parsed)
+    names = dict((group, name) for name, group in state.groupdict.items())
+    inline = ''.join(f for flag, f in _INLINE_FLAGS if state.flags & flag and not flags & flag)
+    return ('(?%s)' % inline if inline else '') + _unparse(parsed.data, names)
+
+
+def _bytes_pattern(pattern, flags=0):
+    # escapes like \xe9 or \u00e9 mean a character in text patterns and
+    # a byte or an error in bytes patterns, so only plain ASCII is kept
+    if '\\' not in pattern:
+        try:
+            return pattern.encode('ascii')
+        except UnicodeEncodeError:
+            pass
+    parsed = sre_parse.parse(pattern, flags)
+    for op, av in _walk(parsed.data):
+        if op is sre_parse.NOT_LITERAL:
+            chars = [av]
+        elif op is sre_parse.IN:
+            chars = [
+                value[1] if kind is sre_parse.RANGE else value
+                for kind, value in av if kind in (sre_parse.LITERAL, sre_parse.RANGE)
+            ]
+        else:
+            continue
+        if any(char > 0x7f for char in chars):
+            raise ValueError(
+                '%s has non-ASCII characters in a character class, '
+                'it can not match UTF-8 bytes'
+                % _unparse([(op, av)], {})
+            )
+    return optimize(pattern, flags).encode('utf-8')
+
+
+def _required_literals(items):
+    literals = []
+    run = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is sre_parse.AT:
+            continue
+        if run:
+            literals.append(''.join(run))
+            run = []
+        if op is sre_parse.SUBPATTERN and not av[1] & re.I:
+            literals.extend(_required_literals(av[3]))
+        elif op in _REPEATS and av[0] > 0:
+            literals.extend(_required_literals(av[2]))
+        elif op is sre_parse.BRANCH:
+            common = _required_literals(av[1][0])
+            for branch in av[1][1:]:
+                found = _required_literals(branch)
+                common = [c for c in common if any(c in literal for literal in found)]
+            literals.extend(common)
+    if run:
+        literals.append(''.join(run))
+    return literals
+
+
+def analyze(hr, warn=False):
+    parsed = sre_parse.parse(str(hr), hr.get_flags())
+    state = _parse_state(parsed)
+    names = dict((group, name) for name, group in state.groupdict.items())
+    risks = []
+    _analyze(parsed.data, state.flags, names, False, risks)
+    if warn:
+        import warnings
+
+        for risk in risks:
+            warnings.warn('%s: %s' % risk, BacktrackingWarning, stacklevel=2)
+    return risks
+
+
+def harden(hr):
+    result = HR()
+    if not POSSESSIVE:
+        result._flags = hr._flags
+        return result.add(str(hr))
+    parsed = sre_parse.parse(str(hr), hr.get_flags())
+    state = _parse_state(parsed)
+    names = dict((group, name) for name, group in state.groupdict.items())
+    result._flags = re.RegexFlag(state.flags & ~re.U | hr.get_flags())
+    return result.add(_unparse(_harden(parsed.data, (), state.flags), names))
+
+
 def ADD(value=None, name=None, quantifier=None):
     return HR().add(value, name=name, quantifier=quantifier)
 
@@ -423,6 +2284,10 @@ def EOL(enable=True):
     return HR().end_of_line(enable)
 
 
+def OF(words, name=None, ignorecase=None, share_suffixes=False):
+    return HR().one_of(words, name=name, ignorecase=ignorecase, share_suffixes=share_suffixes)
+
+
 def MB(value, name=None):
     return HR().maybe(value)
 
@@ -1,9 +1,26 @@
 # encoding: utf-8
+import asyncio
+import concurrent.futures
+import io
+import json
+import mmap
+import os
+import pickle
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
+import warnings
 
 from itertools import combinations
+from operator import methodcaller
 
 from hre import *
+from hre import sre_parse
 
 
 class TestHRE(unittest.TestCase):
@@ -113,6 +130,11 @@ class TestHRE(unittest.TestCase):
         text = "He was carefully disguised but captured quickly by police."
         self.assertEqual(RE(r"\w+ly").test(text), True)
         self.assertEqual(RE(r"\w+zz").test(text), False)
+        self.assertEqual(RE(r"a*").test(text), True)
+
+        self.assertEqual(RE(r"\w+ly").count(text), 2)
+        self.assertEqual(RE(r"\w+zz").count(text), 0)
+        self.assertEqual(RE(r"z*").count('zzaz'), len(RE(r"z*").findall('zzaz')))
 
         self.assertEqual(RE(r"\w+ly").findall(text), ['carefully', 'quickly'])
         self.assertEqual(RE(r"\w+zz").findall(text), [])
@@ -130,6 +152,838 @@ class TestHRE(unittest.TestCase):
             }
         )
 
+    def test_compile_cache(self):
+        my_re = HR().then('cat').prefilter(False)
+        self.assertIs(my_re.compile(), my_re.compile())
+        self.assertTrue(bool(my_re('a cat')))
+        my_re.findall('cat cat')
+        my_re.split('a cat b')
+        self.assertEqual(my_re.compilations, 1)
+
+        my_re.then('s')
+        self.assertFalse(bool(my_re('a cat')))
+        self.assertEqual(my_re.compilations, 2)
+
+        my_re.ignorecase()
+        self.assertTrue(bool(my_re('CATS')))
+        self.assertEqual(my_re.compilations, 3)
+
+        my_re.start_of_line()
+        self.assertFalse(bool(my_re('a cats')))
+        my_re.end_of_line()
+        self.assertTrue(bool(my_re('cats')))
+        self.assertEqual(my_re.compilations, 5)
+
+        my_re = my_re & FM()
+        self.assertTrue(bool(my_re('dogs\ncats')))
+        self.assertEqual(my_re.compilations, 6)
+
+    def test_slots(self):
+        my_re = T('x').I()
+        self.assertIsInstance(my_re, str)
+        self.assertFalse(hasattr(my_re, '__dict__'))
+        self.assertEqual(str(my_re), '(?:x)')
+        self.assertEqual(repr(my_re), "'(?:x)'")
+        self.assertEqual(my_re.I(False).M().get_flags(), re.M)
+
+    def test_compile_cache_lru(self):
+        cache = CompileCache(maxsize=2)
+        a = cache.compile('a')
+        self.assertIs(cache.compile('a'), a)
+        cache.compile('b')
+        cache.compile('a')
+        cache.compile('c')
+        self.assertIn(('a', 0), cache)
+        self.assertNotIn(('b', 0), cache)
+        self.assertEqual(
+            cache.stats(),
+            {'hits': 2, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2}
+        )
+        self.assertIsNot(cache.compile('a', re.I), a)
+
+        cache.maxsize = 1
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.evictions, 3)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hits, 0)
+
+        compile_cache.clear()
+        RE('x+').compile()
+        RE('x+').compile()
+        self.assertEqual(compile_cache.misses, 1)
+        self.assertEqual(compile_cache.hits, 1)
+        self.assertIn(('x+', 0), compile_cache)
+
+    def test_fragments(self):
+        my_re = HR()
+        for _ in range(3000):
+            my_re.then('a')
+        self.assertEqual(str(my_re), '(?:a)' * 3000)
+
+        my_re = T('a')
+        for _ in range(3000):
+            my_re = my_re & T('b') | D()
+        self.assertEqual(str(my_re), '(?:a)' + '(?:b)|\\d' * 3000)
+
+        x = T('x')
+        y = T('y')
+        xy = x & y
+        x_or_y = x | y
+        x.then('z')
+        x_2 = SOL() & x * 2
+        self.assertEqual(str(xy), '(?:x)(?:y)')
+        self.assertEqual(str(x_or_y), '(?:x)|(?:y)')
+        self.assertEqual(str(x), '(?:x)(?:z)')
+        self.assertEqual(str(x_2), '^(?:x)(?:z)(?:x)(?:z)')
+        self.assertEqual(str(RE(SOL() & x, name='n')), '(?P<n>^(?:x)(?:z))')
+
+    def test_iterators(self):
+        text = 'a=1, b=22, c=333'
+        my_re = W(name='key') & T('=') & DS(name='value')
+
+        self.assertEqual([m.group() for m in my_re.finditer(text)], ['a=1', 'b=22', 'c=333'])
+        matches = my_re.iter_groupdicts(text)
+        self.assertIsInstance(next(matches), HumanMatch)
+        self.assertEqual(
+            [(m['key'], m[2]) for m in matches],
+            [('b', '22'), ('c', '333')]
+        )
+        self.assertEqual(list(my_re.iter_groupdicts('zZz')), [])
+
+        for regex, string in [
+            (RE(r'\n+'), 'a\n\nb\nc'),
+            (RE(r',\s*'), text),
+            (RE(r'(,)\s*'), text),
+            (RE(r'(,)|(=)'), text),
+            (RE(r'x*'), 'axbc'),
+            (RE(r'\b'), 'one two'),
+            (RE(r'z'), ''),
+        ]:
+            self.assertEqual(list(regex.isplit(string)), regex.split(string))
+
+    def test_scan(self):
+        text = 'id=1 id=22\nid=333 x id=4444\n' * 50
+        my_re = T('id=') & DS(name='id')
+        expected = list(my_re.iter_groupdicts(text))
+
+        tracemalloc.start()
+        matches = list(my_re.scan(('x' * 100000 + ' id=%d' % i for i in range(20)), max_match=64))
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.assertEqual([m['id'] for m in matches], [str(i) for i in range(20)])
+        self.assertIsInstance(matches[0], HumanMatch)
+        self.assertLess(retained, 100000)
+
+        for chunk_size in (1, 3, 7, 64):
+            self.assertEqual(
+                list(my_re.scan_file(io.StringIO(text), chunk_size=chunk_size, max_match=8)),
+                expected
+            )
+        self.assertEqual(list(my_re.scan(iter(['id=1', '2 id', '=3']), max_match=5)), [
+            {0: 'id=12', 1: '12', 'id': '12'},
+            {0: 'id=3', 1: '3', 'id': '3'},
+        ])
+        self.assertEqual(list(my_re.scan([])), [])
+
+        with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as f:
+            f.write(text)
+        try:
+            self.assertEqual(list(my_re.scan_file(f.name, chunk_size=5, max_match=8)), expected)
+
+            line_re = SOL() & T('id=') & DS(name='id') & EOL()
+            self.assertEqual(list(line_re.scan_file(f.name)), [])
+            self.assertEqual(list(line_re.scan_file(f.name, lines=True)), [])
+            line_re = SOL() & T('id=') & DS(name='id')
+            self.assertEqual(
+                [m['id'] for m in line_re.scan_file(f.name, lines=True)],
+                ['1', '333'] * 50
+            )
+        finally:
+            os.remove(f.name)
+
+    def test_bytes(self):
+        my_re = W(name='key') & T('=') & DS(name='value')
+        data = b'a=1, b=22, c=333'
+
+        for string in (data, bytearray(data), memoryview(data)):
+            self.assertEqual(my_re(string), {0: b'a=1', 1: b'a', 2: b'1', 'key': b'a', 'value': b'1'})
+            self.assertEqual(my_re.search(string).span(), (0, 3))
+            self.assertEqual(my_re.findall(string), [(b'a', b'1'), (b'b', b'22'), (b'c', b'333')])
+            self.assertEqual(my_re.split(string), list(my_re.isplit(string)))
+            self.assertEqual(my_re.replace(string, b'x'), b'x, x, x')
+            self.assertEqual(my_re.count(string), 3)
+            self.assertTrue(my_re.test(string))
+        self.assertEqual(my_re.compilations, 1)
+        self.assertEqual(my_re('a=1')[0], 'a=1')
+        self.assertEqual(my_re.compilations, 2)
+
+        self.assertFalse(my_re.U().compile_bytes().flags & re.U)
+        self.assertIsNot(my_re.compile(), my_re.compile_bytes())
+
+        self.assertEqual(RE('\xe9+').findall('\xe9\xe9a \xe9'.encode('utf-8')), [b'\xc3\xa9\xc3\xa9', b'\xc3\xa9'])
+        for escaped in (r'\xe9+', r'\u00e9+', r'\N{LATIN SMALL LETTER E WITH ACUTE}+', r'[\xe9]+'):
+            self.assertEqual(RE(escaped).findall('a\xe9\xe9'), ['\xe9\xe9'])
+            self.assertEqual(RE(escaped).findall('a\xe9\xe9'.encode('utf-8')), [b'\xc3\xa9\xc3\xa9'])
+        self.assertEqual(RE(r'\x41\d').findall(b'A1 B2'), [b'A1'])
+        self.assertEqual((T('\xfc') & DS(name='n'))('\xfc1'.encode('utf-8'))['n'], b'1')
+        for my_bad_re in (A('\xe9\xfc'), R(['a', '\xe9']), RE('[^\xe9]'), RE(r'[^\xe9]')):
+            self.assertRaises(ValueError, my_bad_re.findall, '\xe9'.encode('utf-8'))
+            self.assertTrue(my_bad_re.test('\xe9x'))
+
+        with tempfile.TemporaryFile() as f:
+            f.write(data * 1000)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                self.assertEqual(my_re.count(mm), 3000)
+                self.assertEqual(my_re.search(mm)['value'], b'1')
+                self.assertEqual(
+                    [m['value'] for m in my_re.scan_file(mm, chunk_size=7, max_match=8)],
+                    [b'1', b'22', b'333'] * 1000
+                )
+            f.seek(0)
+            self.assertEqual(len(list(my_re.scan_file(f, lines=True))), 3000)
+
+    def test_pattern_set(self):
+        routes = PatternSet({
+            'user': SOL() & T('/users/') & DS(name='id') & EOL(),
+            'post': SOL() & T('/posts/') & DS(name='id') & T('/') & W(name='slug') & EOL(),
+            'echo': SOL() & T('/echo/') & RE(r'(\w)\1') & RE(r'(?P<x>a)?(?(x)b|c)(?P=x)?') & EOL(),
+        })
+        routes.add('cat', T('cat').ignorecase())
+
+        self.assertEqual(routes('/users/42'), ('user', {0: '/users/42', 1: '42', 'id': '42'}))
+        self.assertEqual(
+            routes.match('/posts/7/hello'),
+            ('post', {0: '/posts/7/hello', 1: '7', 2: 'hello', 'id': '7', 'slug': 'hello'})
+        )
+        self.assertEqual(routes('/echo/zzaba')[1], {0: '/echo/zzaba', 1: 'z', 2: 'a', 'x': 'a'})
+        self.assertEqual(routes('/echo/zzc')[1], {0: '/echo/zzc', 1: 'z', 2: None, 'x': None})
+        self.assertEqual(routes('/echo/zyc'), (None, {}))
+        self.assertEqual(routes.search('a CAT'), ('cat', {0: 'CAT'}))
+        self.assertEqual(routes.match('a CAT'), (None, {}))
+        self.assertEqual([name for name, _ in routes.finditer('cat, Cat')], ['cat', 'cat'])
+        self.assertEqual(routes(b'/users/42'), ('user', {0: b'/users/42', 1: b'42', 'id': b'42'}))
+        self.assertEqual(len(routes), 4)
+        self.assertIn('cat', routes)
+        self.assertIs(Router, PatternSet)
+
+        routes = PatternSet([('a', RE(r'[(\]](?P<x>\()\((?#(c)')), ('b', RE('(b)'))])
+        self.assertEqual(routes('](((b'), ('a', {0: ']((', 1: '(', 'x': '('}))
+        self.assertEqual(routes('b'), ('b', {0: 'b', 1: 'b'}))
+
+        routes = PatternSet({
+            'verbose': RE('a # c (x)').X(),
+            'inline': RE('(?i)b(c)') & RE(r'\1'),
+            'ascii': RE(r'(?a:\w)') & T('!'),
+            'dotall': RE(r'(?s)d.'),
+        })
+        self.assertEqual(routes('a'), ('verbose', {0: 'a'}))
+        self.assertEqual(routes('BCc'), ('inline', {0: 'BCc', 1: 'C'}))
+        self.assertEqual(routes('\xe9!'), (None, {}))
+        self.assertEqual(routes('x!'), ('ascii', {0: 'x!'}))
+        self.assertEqual(routes('d\n'), ('dotall', {0: 'd\n'}))
+
+        empty = PatternSet()
+        self.assertEqual(empty('x'), (None, {}))
+        self.assertEqual(empty.match(b''), (None, {}))
+        self.assertEqual(list(empty.finditer('xyz')), [])
+        self.assertEqual(empty.add('x', T('x'))('x'), ('x', {0: 'x'}))
+
+    def test_profiler(self):
+        my_re = T('id=') & DS(name='id')
+        search = HumanRegex.search
+        profiler.reset()
+        with profiler:
+            self.assertIsNot(HumanRegex.search, search)
+            my_re('id=1')
+            my_re('nothing')
+            my_re.findall('id=1 id=2')
+            my_re.replace('id=1', 'x')
+            my_re.split('a')
+            T('x').match(b'x')
+        self.assertIs(HumanRegex.search, search)
+        my_re('not recorded')
+
+        stats = profiler.snapshot()[(str(my_re), 0)]
+        self.assertEqual(stats['compile']['calls'], 1)
+        self.assertEqual(stats['search']['calls'], 2)
+        self.assertEqual(stats['search']['input_size'], 11)
+        self.assertEqual(stats['search']['matches'], 1)
+        self.assertEqual(stats['search']['misses'], 1)
+        self.assertEqual(stats['groupdict']['calls'], 2)
+        self.assertEqual(stats['findall']['matches'], 1)
+        self.assertEqual(stats['replace']['matches'], 1)
+        self.assertEqual(stats['split']['misses'], 1)
+        self.assertGreater(stats['search']['seconds'], 0)
+        self.assertEqual(profiler.snapshot()[('(?:x)', 0)]['compile_bytes']['calls'], 1)
+        self.assertEqual(set(profiler.top()), set([(str(my_re), 0), ('(?:x)', 0)]))
+        self.assertEqual(len(profiler.top(1)), 1)
+        profiler.reset()
+        self.assertEqual(profiler.snapshot(), {})
+
+    def test_analyze(self):
+        self.assertEqual(
+            HR().something(quantifier=(1, 5)).analyze(),
+            [BacktrackingRisk('nested_quantifier', '(?:.+){1,5}')]
+        )
+        self.assertEqual([r.kind for r in (AT() & MTP()).analyze()], ['nested_quantifier'])
+        self.assertEqual([r.kind for r in (DS() & D(quantifier=(1, 3))).analyze()], ['overlapping_quantifiers'])
+        self.assertEqual(
+            [r.kind for r in RE(r'(a|a?)+').analyze()],
+            ['nested_quantifier', 'ambiguous_alternation']
+        )
+        self.assertEqual((W(name='k') & T('=') & DS(name='v')).analyze(), [])
+        self.assertEqual(((DS() & T('.')) * 3).analyze(), [])
+        self.assertEqual(RE(r'(?:ab|c)+').analyze(), [])
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            (AT() & MTP()).analyze(warn=True)
+        self.assertEqual(len(caught), 1)
+        self.assertIs(caught[0].category, BacktrackingWarning)
+
+    def test_harden(self):
+        cases = [
+            (W(name='k') & T('=') & DS(name='v') & EOL(), r'(?P<k>\w++)=(?P<v>\d++)$'),
+            (T('"') & STB('"') & T('"'), r'"[^"]++"'),
+            (DS() & T('.') & DS(), r'\d++\.\d++'),
+            (RE(r'a*b?a'), r'a*b?+a'),
+            (RE(r'[a-c]+K').I(), r'[a-c]++K'),
+            (RE(r'[a-z]+K').I(), r'[a-z]+K'),
+            (RE(r'a+(?=a)'), r'a+(?=a)'),
+            (RE(r'(x)\w+\1'), r'(x)\w+(?:\1)'),
+            (W() & WS() & RE(r'[\d_]+') & RE('[^a]+') & T('a'), r'\w++\s[\d_]+[^a]++a'),
+            (RE(r'\s+[\w.-]+\S+\w'), r'\s++[\w\.\-]+\S+\w'),
+            (RE('[A-Z]+\u212a').I(), '[A-Z]+\u212a'),
+            (RE('(?i:[a-z]+K)'), '(?i:[a-z]+K)'),
+            (RE('(?-i:[A-Z]+)k').I(), '(?-i:[A-Z]+)k'),
+            (RE(r'b[^a]+\b'), r'b[^a]+\b'),
+            (RE(r'a?^'), r'a?^'),
+            (RE(r'a\s+$').M(), r'a\s+$'),
+            (RE(r'a\s+$'), r'a\s++$'),
+        ]
+        texts = [
+            'k=12', 'k=12x', '"ab"c"', '1.25', 'aaba', 'ba', 'ACK', 'aaa', 'xyzx', 'xx', 'abK', 'ABK',
+            'bc12 ', 'a \n b',
+        ]
+        for my_re, hardened in cases:
+            hard_re = my_re.harden()
+            self.assertEqual(hard_re.get_flags(), my_re.get_flags())
+            if POSSESSIVE:
+                self.assertEqual(str(hard_re), hardened)
+            else:
+                self.assertEqual(str(hard_re), str(my_re))
+            for text in texts:
+                self.assertEqual(hard_re.findall(text), my_re.findall(text))
+
+        my_re = HR()
+        for i in range(30):
+            my_re = my_re & W(name='w%d' % i) & WS() & DS(name='d%d' % i) & T(';')
+        self.assertEqual(my_re.analyze(), [])
+        self.assertEqual(str(my_re.harden()).count('++'), 60 if POSSESSIVE else 0)
+
+    def test_limits(self):
+        slow_re = RE(r'(a+)+$')
+        evil = 'a' * 40 + 'b'
+
+        start = time.time()
+        with self.assertRaises(MatchTimeout):
+            slow_re.search(evil, timeout=0.1)
+        with self.assertRaises(LimitExceeded):
+            slow_re(evil, timeout=0.1)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(slow_re.search('aaa', timeout=1).group(), 'aaa')
+
+        with self.assertRaises(InputTooLarge):
+            slow_re.test('a' * 11, max_input=10)
+        self.assertTrue(slow_re.test('a' * 10, max_input=10))
+
+        slow_re.limit(timeout=0.1, max_input=100)
+        with self.assertRaises(MatchTimeout):
+            slow_re.findall(evil)
+        with self.assertRaises(InputTooLarge):
+            slow_re.findall('a' * 101)
+        self.assertEqual(slow_re.replace('xaa', 'b'), 'xb')
+        self.assertEqual(slow_re.split('xaa'), ['x', 'aa', ''])
+        self.assertEqual(slow_re.match('aa').group(), 'aa')
+        self.assertEqual(slow_re.findall('a' * 101, max_input=1000), ['a' * 101])
+        for unchecked in (
+            slow_re.finditer, slow_re.count, slow_re.isplit, slow_re.iter_groupdicts,
+            lambda string: list(slow_re.search_many([string])),
+            lambda string: list(slow_re.match_many([string])),
+            lambda string: list(slow_re.test_many([string])),
+            lambda string: list(slow_re.groupdict_many([string])),
+        ):
+            self.assertRaises(InputTooLarge, unchecked, 'a' * 101)
+        self.assertEqual(slow_re.count('a' * 101, max_input=1000), 1)
+        self.assertEqual(list(slow_re.isplit('a' * 101, max_input=1000)), ['', 'a' * 101, ''])
+        slow_re.limit()
+        self.assertEqual(slow_re.findall('a' * 101), ['a' * 101])
+
+        results = []
+
+        def worker():
+            try:
+                slow_re.search(evil, timeout=0.5)
+            except MatchTimeout:
+                results.append('timeout')
+            results.append(slow_re.search('xaaa', timeout=5).span())
+            results.append(slow_re.groupdict(b'xaaa', timeout=5))
+            results.append(slow_re.replace('xaa', methodcaller('expand', r'<\1>'), timeout=5))
+            try:
+                slow_re.replace('xaa', lambda match: 'b', timeout=5)
+            except TypeError:
+                results.append('unpicklable')
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, ['timeout', (1, 4), {0: b'aaa', 1: b'aaa'}, 'x<aa>', 'unpicklable'])
+
+    def test_parallel(self):
+        my_re = T('id=') & DS(name='id')
+        lines = ['id=%d id=%d' % (i, i * 2) if i % 3 else 'nothing' for i in range(1000)]
+
+        self.assertEqual(
+            list(my_re.parallel_findall(lines, workers=2, chunksize=50)),
+            [my_re.findall(line) for line in lines]
+        )
+        self.assertEqual(
+            list(my_re.parallel_groupdicts(iter(lines), workers=2)),
+            [my_re(line) for line in lines]
+        )
+        self.assertEqual(
+            sorted(m['id'] or '' for m in my_re.parallel_groupdicts(lines, workers=3, chunksize=7, ordered=False)),
+            sorted(my_re(line)['id'] or '' for line in lines)
+        )
+        self.assertEqual(list(my_re.I().parallel_findall([b'ID=1'], workers=1)), [[b'1']])
+
+    def test_async(self):
+        my_re = T('id=') & DS(name='id')
+        small = 'x id=1 id=2'
+        large = 'x ' * 100 + 'id=3 id=4'
+
+        class Stream(object):
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+
+            async def read(self, n):
+                return self.data.read(n)
+
+        async def chunks():
+            for chunk in ['id=', '5 i', 'd=6']:
+                yield chunk
+
+        async def main():
+            results = [
+                (await my_re.asearch(small)).group(),
+                (await my_re.amatch(small)),
+                (await my_re.afindall(small)),
+                (await my_re.agroupdict(small))['id'],
+                (await my_re.asearch(large)).span(),
+                (await my_re.amatch(large)),
+                (await my_re.afindall(large)),
+                (await my_re.agroupdict(large.encode()))['id'],
+            ]
+            results.append(await my_re.agroupdict(large))
+            results.append(await my_re.agroupdict('x ' * 100))
+            results.append(await asyncio.gather(*[my_re.afindall(large) for _ in range(5)]))
+            results.append([m['id'] async for m in my_re.ascan(Stream(large.encode() * 3), chunk_size=7, max_match=8)])
+            results.append([m['id'] async for m in my_re.ascan(chunks(), max_match=5)])
+            return results
+
+        executor = async_runner.executor
+        threshold = async_runner.threshold
+        async_runner.executor = concurrent.futures.ProcessPoolExecutor(2)
+        async_runner.threshold = 100
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(main())
+            self.assertIsInstance(results[9], HumanMatch)
+            self.assertIsNone(results[9]['missing'])
+        finally:
+            loop.close()
+            async_runner.executor.shutdown()
+            async_runner.executor = executor
+            async_runner.threshold = threshold
+        self.assertEqual(results, [
+            'id=1', None, ['1', '2'], '1',
+            (200, 204), None, ['3', '4'], b'3',
+            {0: 'id=3', 1: '3', 'id': '3'}, {},
+            [['3', '4']] * 5,
+            [b'3', b'4'] * 3,
+            ['5', '6'],
+        ])
+
+    def test_optimize(self):
+        my_re = (T('abc') & T('d') & MB('x') & A('ab')) | T('a') & T('d')
+        plain = str(my_re)
+        my_re.optimize()
+        self.assertEqual(str(my_re), r'a(?:bcdx?[ab]|d)')
+        self.assertEqual(str(my_re.optimize(False)), plain)
+
+        cases = [
+            ((T('x') | T('y')) & T('z', name='z') & G(T('ab') | T('ac')), 'xzac yzab'),
+            (RE(r'(a|ab)*c') & RS(['0', '9'], name='n'), 'aabc12 c3'),
+            (RE(r'(?P<q>a)?(?(q)b|c)\1?'), 'ab aba c'),
+            (RE(r'(?i)[a-c]+') & STB('-'), 'ABC-x'),
+            (SOL() & T('a') & AT().M(), 'a\nb\nab'),
+            (RE(r'(?<=a)b(?!c)\b'), 'ab abc'),
+            (RE(r'(a)?(?(1)(?:bx|cy)|d)'), 'abx cy d ad'),
+            (RE(r'(a)?(?(1)(?:bx|cy))'), 'cy abx'),
+            (RE(r'(?a:\w)+'), '\xe9a'),
+            (RE(r'(?u:\w)+(?-i:x)').I(), '\xe9aX x'),
+        ]
+        for my_re, text in cases:
+            expected = [(m.span(), m.groups(), m.groupdict()) for m in my_re.finditer(text)]
+            my_re.optimize()
+            self.assertEqual([(m.span(), m.groups(), m.groupdict()) for m in my_re.finditer(text)], expected)
+        self.assertEqual(str((T('a') & T('b')).optimize() & T('c')), 'abc')
+        self.assertEqual(optimize('(?i)(?:a)(?:b)'), '(?i)ab')
+        self.assertEqual(optimize('(?:a'), '(?:a')
+        self.assertEqual(optimize(r'(a)?(?(1)(?:bx|cy)|d)'), r'(a)?(?(1)(?:bx|cy)|d)')
+        self.assertEqual(optimize(r'(?a:\w)+'), r'(?a:\w)+')
+
+    def test_one_of(self):
+        self.assertEqual(str(OF(['cat', 'car', 'cart', 'dog'])), '(?:ca(?:rt?|t)|dog)')
+        self.assertEqual(str(HR().one_of(['a', 'b'])), '[ab]')
+        self.assertEqual(str(OF(['a.', 'a-'])), r'(?:a[\-\.])')
+        self.assertEqual(
+            str(OF(['walking', 'talking', 'walk', 'talk'], share_suffixes=True)),
+            '(?:[tw]alk(?:ing)?)'
+        )
+        self.assertEqual(str(OF(['Foo', 'fOx'], ignorecase=True)), '(?i:fo[ox])')
+        self.assertEqual(str(OF(['x'], name='w', ignorecase=False)), '(?P<w>(?-i:x))')
+
+        words = ['cat', 'car', 'cart', 'dog', 'do', 'a+b', '']
+        for share_suffixes in (False, True):
+            my_re = SOL() & OF(words, name='word', share_suffixes=share_suffixes) & EOL()
+            for word in words:
+                self.assertEqual(my_re(word)['word'], word)
+            for word in ['ca', 'carts', 'd', 'ab', 'x']:
+                self.assertFalse(bool(my_re(word)))
+        self.assertEqual((OF(['cat', 'cart']) & T('!')).findall('cart! cat!'), ['cart!', 'cat!'])
+        self.assertEqual((T('x') & OF(['a', 'bc']) & MTP()).findall('xabca xbcbc'), ['xabca', 'xbcbc'])
+        self.assertFalse(OF([]).test('anything'))
+
+        long_words = ['x' * 3000, 'x' * 2999 + 'y', 'z' * 5000]
+        my_re = SOL() & OF(long_words, name='word') & EOL()
+        self.assertEqual(str(OF(long_words)), '(?:' + 'x' * 2999 + '[xy]|' + 'z' * 5000 + ')')
+        for word in long_words:
+            self.assertEqual(my_re(word)['word'], word)
+        self.assertFalse(my_re.test('x' * 2999))
+        deep = ['a' * depth + 'b' for depth in range(1500)]
+        self.assertEqual(str(OF(deep)).count('(?:'), 1499)
+
+    def test_prefilter(self):
+        my_re = T('ERROR') & WS() & RE(r'(?:disk|disk full|\w+disk)') & RE('(?:x{2}|x?)')
+        self.assertEqual(my_re.required_literals(), ('ERROR', 'disk'))
+        self.assertEqual(RE(r'(?:ab)+c|zab').required_literals(), ('ab',))
+        self.assertEqual(RE(r'a\bb(c)?').required_literals(), ('ab',))
+        self.assertEqual(RE(r'a*b?').required_literals(), ())
+        self.assertEqual(T('abc').I().required_literals(), ())
+        self.assertEqual(RE('(?i)abc').required_literals(), ())
+        self.assertEqual(RE('x(?i:abc)').required_literals(), ('x',))
+
+        my_re = T('ERROR') & W(name='word')
+        self.assertIsNone(my_re.search('INFO ok'))
+        self.assertIsNone(my_re.match('INFO ok'))
+        self.assertEqual(my_re.findall('INFO ok'), [])
+        self.assertEqual(my_re.compilations, 0)
+        self.assertEqual(my_re('x ERRORdisk')['word'], 'disk')
+        self.assertEqual(my_re.findall(b'ERRORa ERRORb'), [b'a', b'b'])
+        self.assertFalse(my_re.test(bytearray(b'INFO')))
+        self.assertEqual(my_re.compilations, 2)
+
+        my_re.prefilter(False)
+        self.assertFalse(my_re.test('INFO ok'))
+        my_re.prefilter()
+        my_re.then('!')
+        self.assertFalse(my_re.test('ERRORdisk'))
+        self.assertTrue(my_re.test('ERRORdisk!'))
+
+    def test_engine(self):
+        class RestrictedEngine(Engine):
+            name = 'restricted'
+            flags = re.I | re.U
+            unsupported = (sre_parse.GROUPREF,)
+            max_repeat = 5
+
+        class MissingEngine(Engine):
+            name = 'missing'
+            module_name = 'hre_missing_engine'
+
+        class FakeRE2Engine(RE2Engine):
+            name = 'fake_re2'
+            module_name = 're'
+
+        self.assertEqual(engines.available()[0], 're')
+        engines.register(RestrictedEngine())
+        engines.register(MissingEngine())
+        engines.register(FakeRE2Engine())
+        try:
+            compile_cache.clear()
+            my_re = (W(name='k') & T('=')).engine('restricted')
+            self.assertEqual(my_re.get_engine(), 'restricted')
+            self.assertEqual(my_re('x= y')['k'], 'x')
+            self.assertIn((str(my_re), 0, 'restricted'), compile_cache)
+            self.assertEqual((my_re & DS()).get_engine(), 'restricted')
+
+            self.assertEqual(RE(r'(a)\1').engine('restricted').get_engine(), 're')
+            self.assertEqual(RE('a{9}').engine('restricted').get_engine(), 're')
+            self.assertEqual(T('a').M().engine('restricted').get_engine(), 're')
+            self.assertEqual(RE('(?s)a').engine('restricted').get_engine(), 're')
+            self.assertEqual(T('a').engine('missing').get_engine(), 're')
+            self.assertTrue(T('a').engine('missing').test('cba'))
+            self.assertEqual(T('a').engine('re2').get_engine(), 're2' if engines['re2'].available else 're')
+            self.assertFalse(engines['missing'].available)
+
+            self.assertEqual(T('a').engine('fake_re2').get_engine(), 'fake_re2')
+            self.assertEqual(RE('a$').engine('fake_re2').get_engine(), 're')
+            self.assertEqual(RE('a$').M().engine('fake_re2').get_engine(), 'fake_re2')
+            self.assertEqual(RE('(?m)a$').engine('fake_re2').get_engine(), 'fake_re2')
+            self.assertEqual(D().engine('fake_re2').get_engine(), 're')
+            self.assertEqual(RE(r'[a-z\s]').engine('fake_re2').get_engine(), 're')
+            self.assertEqual(W().engine('fake_re2').get_engine(), 're')
+            self.assertEqual(RE(r'\ba').engine('fake_re2').get_engine(), 're')
+
+            before = T('a')
+            frozen = T('b').freeze()
+            self.assertTrue(before.test('a'))
+            engines.default = 'restricted'
+            self.assertEqual(T('a').get_engine(), 'restricted')
+            self.assertEqual(T('a').engine('re').get_engine(), 're')
+            self.assertTrue(before.test('a'))
+            self.assertTrue(frozen.test('b'))
+            self.assertIn((str(before), 0, 'restricted'), compile_cache)
+            self.assertIn((str(frozen), 0, 'restricted'), compile_cache)
+            engines.default = 're'
+            self.assertIsInstance(before.compile(), type(re.compile('')))
+            self.assertEqual(before.compilations, 3)
+        finally:
+            engines.default = 're'
+            del engines['restricted']
+            del engines['missing']
+            del engines['fake_re2']
+        self.assertRaises(ValueError, T('a').engine, 'restricted')
+
+    def test_freeze(self):
+        my_re = W(name='k') & T('=') & DS(name='v')
+        frozen = my_re.freeze()
+        self.assertIsInstance(frozen, FrozenHR)
+        self.assertIs(frozen.freeze(), frozen)
+        self.assertEqual(str(frozen), str(my_re))
+        self.assertEqual(frozen.groupindex, {'k': 1, 'v': 2})
+        self.assertEqual(frozen.compilations, 1)
+        self.assertEqual(frozen('a=1')['v'], '1')
+
+        self.assertEqual(frozen, my_re.freeze())
+        self.assertEqual(hash(frozen), hash(my_re.freeze()))
+        self.assertNotEqual(frozen, my_re.I().freeze())
+        self.assertNotEqual(frozen, T('k').freeze())
+        self.assertNotEqual(frozen, str(frozen))
+        self.assertNotEqual(str(frozen), frozen)
+        self.assertNotEqual(frozen, my_re)
+        self.assertFalse(frozen == str(frozen))
+        self.assertEqual(len({frozen, str(frozen)}), 2)
+        cache = {frozen: 'kv'}
+        self.assertEqual(cache[(W(name='k') & T('=') & DS(name='v')).freeze()], 'kv')
+
+        for mutate in (
+            lambda: frozen.then('x'), lambda: frozen.I(), lambda: frozen.start_of_line(),
+            lambda: frozen.limit(1), lambda: frozen.engine('re'), lambda: frozen.optimize(),
+        ):
+            self.assertRaises(TypeError, mutate)
+        self.assertEqual(str(frozen), r'(?P<k>\w+)(?:=)(?P<v>\d+)')
+
+        with_flag = frozen & FI()
+        self.assertIsInstance(with_flag, FrozenHR)
+        self.assertEqual(with_flag.get_flags(), re.I)
+        self.assertEqual(frozen.get_flags(), 0)
+        combined = frozen | T('x')
+        self.assertIsInstance(combined, FrozenHR)
+        self.assertIs(combined._fragments[0], frozen._fragments)
+        self.assertIsInstance(D().freeze() * 2, FrozenHR)
+
+        thawed = frozen.thaw().then('!')
+        self.assertNotIsInstance(thawed, FrozenHR)
+        self.assertEqual(str(thawed), str(frozen) + '(?:!)')
+        self.assertEqual(pickle.loads(pickle.dumps(frozen)), frozen)
+
+        results = []
+
+        def worker():
+            results.append([frozen('k%d=%d' % (i, i))['v'] for i in range(200)])
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [[str(i) for i in range(200)]] * 4)
+
+    def test_library(self):
+        patterns = {
+            'kv': (W(name='k') & T('=') & DS(name='v')).I(),
+            'line': SOL() & T('id') & EOL(),
+            'word': OF(['cat', 'car']).optimize(),
+        }
+        library = PatternLibrary(patterns)
+        data = io.StringIO()
+        library.dump(data, key='v1')
+
+        data.seek(0)
+        loaded = PatternLibrary.load(data, key='v1')
+        self.assertEqual(list(loaded), ['kv', 'line', 'word'])
+        self.assertEqual(loaded.groupindex['kv'], {'k': 1, 'v': 2})
+        for name, hr in patterns.items():
+            self.assertEqual(str(loaded[name]), str(hr))
+            self.assertEqual(loaded[name].get_flags(), hr.get_flags())
+            self.assertEqual(loaded[name].compilations, 0)
+        self.assertEqual(loaded['kv']('A=1')['v'], '1')
+        self.assertEqual(str(loaded['line'].then('!')), '^(?:id)(?:!)$')
+
+        data.seek(0)
+        self.assertRaises(StaleLibrary, PatternLibrary.load, data, key='v2')
+        data = io.StringIO(data.getvalue().replace('"k"', '"K"'))
+        self.assertRaises(StaleLibrary, PatternLibrary.load, data, key='v1')
+        self.assertRaises(StaleLibrary, PatternLibrary.load, io.StringIO('[]\n[]'))
+
+        path = os.path.join(tempfile.mkdtemp(), 'patterns.json')
+        built = []
+
+        def build():
+            built.append(1)
+            return patterns
+
+        loaded = PatternLibrary.load(path, key='v1', build=build, compile='eager')
+        self.assertTrue(loaded.compiled.is_set())
+        self.assertEqual(loaded['kv'].compilations, 1)
+        loaded = PatternLibrary.load(path, key='v1', build=build, compile='background')
+        self.assertTrue(loaded.wait(5))
+        self.assertEqual(loaded['word'].compilations, 1)
+        PatternLibrary.load(path, key='v2', build=build)
+        self.assertEqual(len(built), 2)
+        self.assertEqual(len(PatternLibrary.load(path, key='v2')), 3)
+        os.remove(path)
+        self.assertRaises(OSError, PatternLibrary.load, path)
+
+    def test_import(self):
+        modules = (
+            'atexit', 'collections.abc', 'hashlib', 'json', 'multiprocessing', 'signal', 'threading',
+            'warnings', 'weakref',
+        )
+        script = 'import sys; %s; print(sorted(m for m in %r if m in sys.modules))'
+        baseline = subprocess.check_output([sys.executable, '-c', script % ('pass', modules)])
+        loaded = subprocess.check_output(
+            [sys.executable, '-c', script % ('from hre import HR, RE, T, FI', modules)],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        self.assertEqual(loaded, baseline)
+
+    def test_match_view(self):
+        my_re = (W(name='key') & T('=') & DS(name='value')) | (T('!') & W(name='flag'))
+        my_match = my_re.match_view('a=1')
+        self.assertIsInstance(my_match, MatchView)
+        self.assertTrue(my_match)
+        self.assertEqual(my_match[0], 'a=1')
+        self.assertEqual(my_match['key'], 'a')
+        self.assertEqual(my_match[2], '1')
+        self.assertIsNone(my_match['flag'])
+        self.assertIsNone(my_match['missing'])
+        self.assertIsNone(my_match[9])
+        self.assertEqual(my_match.get('flag', 'no'), 'no')
+        self.assertEqual(my_match.get('missing', 'no'), 'no')
+        self.assertEqual(my_match.get('key', 'no'), 'a')
+        self.assertIn('flag', my_match)
+        self.assertNotIn('missing', my_match)
+        self.assertEqual(list(my_match), [0, 1, 2, 3, 'key', 'value', 'flag'])
+        self.assertEqual(len(my_match), 7)
+        self.assertEqual(my_match, {0: 'a=1', 1: 'a', 2: '1', 3: None, 'key': 'a', 'value': '1', 'flag': None})
+        self.assertIs(my_re.match_view('b=2')._keys, my_match._keys)
+        self.assertEqual(my_re('a=1'), my_match)
+
+        copied = pickle.loads(pickle.dumps(my_match))
+        self.assertIsInstance(copied, HumanMatch)
+        self.assertEqual(copied, my_match)
+
+        no_match = my_re.match_view('zzz')
+        self.assertFalse(no_match)
+        self.assertEqual(no_match, {})
+        self.assertIsNone(no_match['key'])
+        self.assertEqual(no_match.get('key', 'no'), 'no')
+        self.assertEqual(my_re.groupdict(b'c=3')['value'], b'3')
+
+        human_match = my_re('a=1')
+        self.assertIsInstance(human_match, HumanMatch)
+        self.assertIsNone(human_match['missing'])
+        self.assertEqual(human_match.get('flag', 'no'), 'no')
+        self.assertEqual(
+            json.loads(json.dumps(my_re('!x'))),
+            {'0': '!x', '1': None, '2': None, '3': 'x', 'key': None, 'value': None, 'flag': 'x'}
+        )
+        human_match['key'] = 'b'
+        human_match.update(extra=1)
+        self.assertEqual(human_match.copy()['extra'], 1)
+        self.assertEqual(my_re('a=1')['key'], 'a')
+        self.assertFalse(my_re('zzz'))
+
+    def test_extract_columns(self):
+        my_re = W(name='name') & T(' count=') & DS(name='count') & RE(r'(?: ratio=(?P<ratio>[\d.]+))?')
+        lines = ['a count=3 ratio=0.5', 'b count=4', 'nothing']
+        columns = my_re.extract_columns(lines, dtypes={'count': int, 'ratio': float}, use_numpy=False)
+        self.assertEqual(list(columns), ['name', 'count', 'ratio'])
+        self.assertEqual(columns['name'], ['a', 'b', None])
+        self.assertEqual(columns['count'], [3, 4, None])
+        self.assertEqual(columns['ratio'], [0.5, None, None])
+        self.assertEqual(
+            my_re.extract_columns(iter([]), use_numpy=False),
+            {'name': [], 'count': [], 'ratio': []}
+        )
+        self.assertEqual(my_re.extract_columns([b'x count=1'], use_numpy=False)['count'], [b'1'])
+        self.assertRaises(ValueError, my_re.extract_columns, lines, {'size': int})
+
+        try:
+            import numpy
+        except ImportError:
+            self.assertRaises(ImportError, my_re.extract_columns, lines, use_numpy=True)
+            self.assertEqual(my_re.extract_columns(lines)['count'], ['3', '4', None])
+            return
+        columns = my_re.extract_columns(lines, dtypes={'count': int, 'ratio': float})
+        self.assertEqual(columns['count'].dtype, numpy.dtype(int))
+        self.assertEqual(columns['count'].tolist(), [3, 4, None])
+        self.assertEqual(columns['ratio'].dtype, numpy.dtype(float))
+        self.assertEqual(list(columns['ratio'].mask), [False, True, True])
+        self.assertEqual(columns['name'].tolist(), ['a', 'b', None])
+        self.assertEqual(my_re.extract_columns(['zz'], dtypes={'count': int})['count'].tolist(), [None])
+
+    def test_many(self):
+        my_re = HR().digits(name='number')
+        lines = ['number: 25', 'zZz', '42']
+
+        self.assertEqual(
+            [m.group() if m else None for m in my_re.search_many(lines)],
+            ['25', None, '42']
+        )
+        self.assertEqual(
+            [m.group() if m else None for m in my_re.match_many(lines)],
+            [None, None, '42']
+        )
+        self.assertEqual(list(my_re.test_many(lines)), [True, False, True])
+        self.assertEqual(
+            [m['number'] for m in my_re.groupdict_many(iter(lines))],
+            ['25', None, '42']
+        )
+        self.assertEqual(list(my_re.groupdict_many(lines)), [my_re(line) for line in lines])
+        self.assertEqual(my_re.compilations, 1)
+
+        mixed = ['a 1', b'b 2', bytearray(b'c')]
+        self.assertEqual([m.group() if m else None for m in my_re.search_many(mixed)], ['1', b'2', None])
+        self.assertEqual(list(my_re.test_many(mixed)), [True, True, False])
+        self.assertEqual([m['number'] for m in my_re.groupdict_many(mixed)], ['1', b'2', None])
+        self.assertEqual(my_re.compilations, 2)
+
     def test_then(self):
         then_re = HR().then('@')
         then_match = then_re('a@b')